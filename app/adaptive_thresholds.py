@@ -8,8 +8,92 @@ Problem: Same threshold (0.75) for all questions?
 Solution: Adapt threshold based on question complexity!
 """
 
-from app.rate_limit import rate_limit
-from app.llm_client import get_available_client
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+THRESHOLDS_FILE = "data/thresholds.json"
+
+# Try to import numba (compiled kernels for the batch threshold functions)
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Complexity indicators, built once.
+# Question words are matched as whole tokens via set membership (so "whole"
+# no longer counts as "who"); phrases and stems stay as substring regexes so
+# "relate" still matches "related"/"relationship".
+_SIMPLE_TOKENS = frozenset({"what", "who", "when", "where"})
+_MODERATE_TOKENS = frozenset({"why"})
+
+_SIMPLE_WORDS = ["how do", "how many", "how much"]
+_MODERATE_WORDS = ["compare", "contrast", "difference", "similarity", "how does"]
+_COMPLEX_WORDS = ["explain", "relate", "implication", "consequence", "cause effect",
+                  "mechanism", "complex", "analyze", "relationship", "impact"]
+
+_SIMPLE_RE = re.compile("|".join(map(re.escape, _SIMPLE_WORDS)))
+_MODERATE_RE = re.compile("|".join(map(re.escape, _MODERATE_WORDS)))
+_COMPLEX_RE = re.compile("|".join(map(re.escape, _COMPLEX_WORDS)))
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Lookup tables mirroring the adjust_threshold_* if/elif ladders, for the
+# batch variants: one row per branch -> (delta, lower clamp, upper clamp)
+_CTX_BREAKS = np.array([3, 5])          # < 3, < 5, otherwise (> 20 handled separately)
+_CTX_DELTAS = np.array([-0.15, -0.10, 0.0, 0.05])
+_CTX_LOWER = np.array([0.50, 0.55, -np.inf, -np.inf])
+_CTX_UPPER = np.array([np.inf, np.inf, np.inf, 0.95])
+
+_CONF_BREAKS = np.array([0.5, 0.7])     # < 0.5, < 0.7, otherwise
+_CONF_DELTAS = np.array([0.10, 0.0, -0.05])
+_CONF_LOWER = np.array([-np.inf, -np.inf, 0.50])
+_CONF_UPPER = np.array([0.95, np.inf, np.inf])
+
+if NUMBA_AVAILABLE:
+    # Straight-line compiled versions of the if/elif ladders; cache=True keeps
+    # the compiled code on disk so only the first run pays the JIT cost.
+    @njit(cache=True)
+    def _adjust_by_context_kernel(base, sizes, out):
+        for i in range(base.shape[0]):
+            b = base[i]
+            n = sizes[i]
+            if n < 3:
+                out[i] = max(0.5, b - 0.15)
+            elif n < 5:
+                out[i] = max(0.55, b - 0.10)
+            elif n > 20:
+                out[i] = min(0.95, b + 0.05)
+            else:
+                out[i] = b
+        return out
+    
+    @njit(cache=True)
+    def _adjust_by_confidence_kernel(base, confidences, out):
+        for i in range(base.shape[0]):
+            b = base[i]
+            c = confidences[i]
+            if c < 0.5:
+                out[i] = min(0.95, b + 0.10)
+            elif c < 0.7:
+                out[i] = b
+            else:
+                out[i] = max(0.5, b - 0.05)
+        return out
+
+
+def _run_kernel(kernel, base_thresholds, values) -> np.ndarray:
+    """Broadcast inputs, run a compiled 1-D kernel and restore the shape."""
+    base, values = np.broadcast_arrays(
+        np.asarray(base_thresholds, dtype=np.float64), np.asarray(values)
+    )
+    out = np.empty(base.shape, dtype=np.float64)
+    kernel(base.ravel(), values.ravel(), out.reshape(-1))
+    return out
 
 class AdaptiveThreshold:
     """
@@ -32,27 +116,20 @@ class AdaptiveThreshold:
         Complex: Explain how X causes Y. What are implications of X?
         """
         
+        q = question.lower()
+        tokens = frozenset(_WORD_RE.findall(q))
+        
         # Count complexity indicators
         complexity_score = 0
-        
-        # Simple indicators
-        simple_words = ["what", "who", "when", "where", "how do", "how many", "how much", "what is"]
-        if any(word in question.lower() for word in simple_words):
+        if not tokens.isdisjoint(_SIMPLE_TOKENS) or _SIMPLE_RE.search(q):
             complexity_score -= 1
-        
-        # Moderate indicators
-        moderate_words = ["compare", "contrast", "difference", "similarity", "why", "how does"]
-        if any(word in question.lower() for word in moderate_words):
+        if not tokens.isdisjoint(_MODERATE_TOKENS) or _MODERATE_RE.search(q):
             complexity_score += 1
-        
-        # Complex indicators
-        complex_words = ["explain", "relate", "implication", "consequence", "cause effect", 
-                        "mechanism", "complex", "analyze", "relationship", "impact"]
-        if any(word in question.lower() for word in complex_words):
+        if _COMPLEX_RE.search(q):
             complexity_score += 2
         
         # Question length (longer = often more complex)
-        word_count = len(question.split())
+        word_count = len(q.split())
         if word_count > 20:
             complexity_score += 1
         if word_count > 30:
@@ -80,19 +157,17 @@ class AdaptiveThreshold:
             }
         """
         complexity, confidence = AdaptiveThreshold.classify_question_complexity(question)
+        threshold = load_calibrated_thresholds()[complexity]
         
         if complexity == "simple":
-            threshold = AdaptiveThreshold.BASE_SIMPLE
             retrieval_count = 5  # Fewer results needed
             reasoning = "Simple question needs exact matches, high threshold"
         
         elif complexity == "moderate":
-            threshold = AdaptiveThreshold.BASE_MODERATE
             retrieval_count = 8  # Medium number of results
             reasoning = "Moderate complexity, balanced threshold"
         
         else:  # complex
-            threshold = AdaptiveThreshold.BASE_COMPLEX
             retrieval_count = 12  # More results might be needed
             reasoning = "Complex question, relaxed threshold to capture context"
         
@@ -153,49 +228,128 @@ class AdaptiveThreshold:
             return max(0.5, base_threshold - 0.05)
         
         return base_threshold
+    
+    @staticmethod
+    def adjust_threshold_by_context_batch(base_thresholds, context_sizes) -> np.ndarray:
+        """
+        Vectorized adjust_threshold_by_context for many queries at once.
+        Uses the compiled numba kernel when numba is installed.
+        
+        Args:
+            base_thresholds: Array (or scalar) of original thresholds
+            context_sizes: Array (or scalar) of context sizes
+        
+        Returns:
+            Array of adjusted thresholds (same rules as the scalar version)
+        """
+        if NUMBA_AVAILABLE:
+            return _run_kernel(_adjust_by_context_kernel, base_thresholds, context_sizes)
+        
+        base = np.asarray(base_thresholds, dtype=float)
+        sizes = np.asarray(context_sizes)
+        
+        branch = np.searchsorted(_CTX_BREAKS, sizes, side="right")
+        branch = np.where(sizes > 20, 3, branch)
+        
+        return np.clip(base + _CTX_DELTAS[branch], _CTX_LOWER[branch], _CTX_UPPER[branch])
+    
+    @staticmethod
+    def adjust_threshold_by_confidence_batch(base_thresholds, retrieval_confidences) -> np.ndarray:
+        """
+        Vectorized adjust_threshold_by_confidence for many queries at once.
+        Uses the compiled numba kernel when numba is installed.
+        
+        Args:
+            base_thresholds: Array (or scalar) of original thresholds
+            retrieval_confidences: Array (or scalar) of 0-1 confidences
+        
+        Returns:
+            Array of adjusted thresholds (same rules as the scalar version)
+        """
+        if NUMBA_AVAILABLE:
+            return _run_kernel(_adjust_by_confidence_kernel, base_thresholds, retrieval_confidences)
+        
+        base = np.asarray(base_thresholds, dtype=float)
+        branch = np.searchsorted(_CONF_BREAKS, retrieval_confidences, side="right")
+        
+        return np.clip(base + _CONF_DELTAS[branch], _CONF_LOWER[branch], _CONF_UPPER[branch])
 
 
-@rate_limit(max_calls=15, time_window=60)
-def llm_suggest_threshold(question: str, candidate_chunks: list[str]) -> float:
+# Defaults per complexity tier, overridden by data/thresholds.json if present
+_BASE_THRESHOLDS = {
+    "simple": AdaptiveThreshold.BASE_SIMPLE,
+    "moderate": AdaptiveThreshold.BASE_MODERATE,
+    "complex": AdaptiveThreshold.BASE_COMPLEX,
+}
+
+
+def calibrate_thresholds(dataset: list[dict], percentile: float = 5,
+                         output_file: str = THRESHOLDS_FILE) -> dict:
     """
-    Use LLM to intelligently suggest threshold based on actual content.
+    Fit per-complexity thresholds offline from labelled examples.
+    
+    For each {"question": ..., "context": ...} pair (context = the gold
+    passage that answers the question), embed both and take their cosine
+    similarity. The threshold for each complexity tier is the given low
+    percentile of its scores, i.e. ~95% of good matches pass by default.
+    Tiers without examples keep their BASE_* value.
+    
+    Run once (or whenever the corpus/model changes); the result is saved
+    to data/thresholds.json and used at query time without any LLM call.
     
-    This is more sophisticated but costs more (LLM call).
-    Use occasionally to calibrate, not for every query.
+    Returns:
+        {"simple": 0.78, "moderate": 0.66, "complex": 0.52}
     """
+    from app.embeddings import embed_texts
     
-    prompt = f"""
-Question: {question}
+    questions = [item["question"] for item in dataset]
+    contexts = [item["context"] for item in dataset]
+    
+    # Embeddings are L2-normalized, so the row-wise dot is the cosine
+    scores = np.einsum("ij,ij->i", embed_texts(questions), embed_texts(contexts))
+    tiers = np.array([
+        AdaptiveThreshold.classify_question_complexity(q)[0] for q in questions
+    ])
+    
+    thresholds = dict(_BASE_THRESHOLDS)
+    for tier in thresholds:
+        tier_scores = scores[tiers == tier]
+        if len(tier_scores):
+            thresholds[tier] = round(float(np.percentile(tier_scores, percentile)), 4)
+    
+    path = Path(output_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(thresholds, f)
+    
+    load_calibrated_thresholds.cache_clear()
+    return thresholds
 
-I have {len(candidate_chunks)} candidate documents. Should I:
-1. Be STRICT (threshold 0.85): Only keep best matches
-2. Be MODERATE (threshold 0.70): Keep good and decent matches
-3. Be RELAXED (threshold 0.55): Keep all potentially relevant matches
 
-Return ONLY one number: 0.85, 0.70, or 0.55
-Base your answer on how specific/complex the question is.
-"""
-    
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=10
-        )
-        
-        response_text = response.choices[0].message.content.strip()
-        
-        # Extract number
-        if "0.85" in response_text:
-            return 0.85
-        elif "0.55" in response_text:
-            return 0.55
-        else:
-            return 0.70
+@lru_cache(maxsize=1)
+def load_calibrated_thresholds(thresholds_file: str = THRESHOLDS_FILE) -> dict:
+    """
+    Per-complexity thresholds from calibrate_thresholds, or the BASE_* defaults.
+    """
+    thresholds = dict(_BASE_THRESHOLDS)
+    path = Path(thresholds_file)
+    if path.exists():
+        with open(path, 'r') as f:
+            thresholds.update(json.load(f))
+    return thresholds
+
+
+def llm_suggest_threshold(question: str, candidate_chunks: list[str]) -> float:
+    """
+    Suggest a threshold for a question.
     
-    except:
-        return 0.70  # Default to moderate
+    Previously asked the LLM to choose between 0.85/0.70/0.55 on every call;
+    now a lookup of the calibrated threshold for the question's complexity
+    tier (see calibrate_thresholds), so it costs no network round-trip.
+    candidate_chunks is kept for API compatibility.
+    """
+    complexity, _ = AdaptiveThreshold.classify_question_complexity(question)
+    return load_calibrated_thresholds()[complexity]
 
 
 class DynamicThresholdManager:
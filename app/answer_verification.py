@@ -11,8 +11,19 @@ Check: Is "Moon orbits Earth" in context? NO ❌
 Result: Return "Answer not found in documents" (no hallucination!)
 """
 
+import asyncio
+import re
+
 from app.rate_limit import rate_limit
-from app.llm_client import get_available_client
+from app.llm_client import get_available_client, complete
+
+# "GROUNDED: / CONFIDENCE: / REASONING:" fields of the verify_answer response
+_GROUNDED_RE = re.compile(r"grounded:\s*(yes|no)", re.IGNORECASE)
+_CONFIDENCE_RE = re.compile(r"confidence:\s*(\d*\.?\d+)", re.IGNORECASE)
+_REASONING_RE = re.compile(r"reasoning:[ \t]*(.*)", re.IGNORECASE)
+
+# "<claim number>: VERIFIED" / "<claim number>: UNVERIFIED" lines
+_CLAIM_RESULT_RE = re.compile(r"^\s*(\d+)\s*:\s*(UN)?VERIFIED", re.IGNORECASE | re.MULTILINE)
 
 @rate_limit(max_calls=20, time_window=60)
 def verify_answer(answer: str, context: str, question: str, threshold: float = 0.6) -> dict:
@@ -68,20 +79,8 @@ REASONING: <Brief explanation>
 """
     
     try:
-        if llm_config["type"] == "openai":
-            response = llm_config["client"].chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": verification_prompt}],
-                temperature=0.2,
-                max_tokens=200
-            )
-        elif llm_config["type"] == "groq":
-            response = llm_config["client"].messages.create(
-                model="llama-3.3-70b-versatile",
-                max_tokens=200,
-                messages=[{"role": "user", "content": verification_prompt}]
-            )
-        else:
+        verification_text = complete(verification_prompt, max_tokens=200)
+        if verification_text is None:
             return {
                 "is_grounded": True,
                 "confidence": 0.5,
@@ -89,31 +88,18 @@ REASONING: <Brief explanation>
                 "verified_answer": answer
             }
         
-        if llm_config["type"] == "openai":
-            verification_text = response.choices[0].message.content.strip()
+        # Parse response: one regex search per field, no line splitting
+        grounded_match = _GROUNDED_RE.search(verification_text)
+        if grounded_match:
+            is_grounded = grounded_match.group(1).lower() == "yes"
         else:
-            verification_text = response.content[0].text.strip()
-        
-        # Parse response
-        is_grounded = "yes" in verification_text.lower()[:100]
+            is_grounded = "yes" in verification_text[:100].lower()
         
-        # Extract confidence
-        confidence = 0.5
-        if "confidence:" in verification_text.lower():
-            try:
-                conf_line = [l for l in verification_text.split('\n') if 'confidence:' in l.lower()][0]
-                conf_str = conf_line.split(':')[1].strip()
-                confidence = float(conf_str.split()[0])
-            except:
-                pass
+        confidence_match = _CONFIDENCE_RE.search(verification_text)
+        confidence = float(confidence_match.group(1)) if confidence_match else 0.5
         
-        reasoning = ""
-        if "reasoning:" in verification_text.lower():
-            try:
-                reasoning_line = [l for l in verification_text.split('\n') if 'reasoning:' in l.lower()][0]
-                reasoning = reasoning_line.split(':', 1)[1].strip()
-            except:
-                reasoning = verification_text
+        reasoning_match = _REASONING_RE.search(verification_text)
+        reasoning = reasoning_match.group(1).strip() if reasoning_match else ""
         
         return {
             "is_grounded": is_grounded and confidence >= threshold,
@@ -132,6 +118,15 @@ REASONING: <Brief explanation>
         }
 
 
+def _fallback_answer(context: str) -> str:
+    """Message returned instead of an answer that isn't grounded."""
+    return (
+        f"I couldn't find a clear answer in the provided documents. "
+        f"Based on the context: {context[:200]}... "
+        f"Please provide more specific documents for this question."
+    )
+
+
 def verify_and_fallback(answer: str, context: str, question: str, 
                        threshold: float = 0.6) -> tuple[str, dict]:
     """
@@ -143,12 +138,40 @@ def verify_and_fallback(answer: str, context: str, question: str,
     verification = verify_answer(answer, context, question, threshold)
     
     if not verification["is_grounded"]:
-        fallback_answer = (
-            f"I couldn't find a clear answer in the provided documents. "
-            f"Based on the context: {context[:200]}... "
-            f"Please provide more specific documents for this question."
+        return _fallback_answer(context), verification
+    
+    return answer, verification
+
+
+async def verify_and_fallback_async(answer: str, context: str, question: str,
+                                    threshold: float = 0.6,
+                                    check_claims: bool = False) -> tuple[str, dict]:
+    """
+    Async version of verify_and_fallback for use inside request handlers.
+    
+    The blocking LLM calls run in worker threads so the event loop stays free.
+    With check_claims=True, claim extraction runs concurrently with the
+    grounding check (they don't depend on each other), and the claim
+    coverage is added to the verification info under "claims".
+    
+    Returns:
+        (final_answer, verification_info)
+    """
+    if check_claims:
+        verification, claims = await asyncio.gather(
+            asyncio.to_thread(verify_answer, answer, context, question, threshold),
+            asyncio.to_thread(extract_key_claims, answer)
+        )
+        verification["claims"] = await asyncio.to_thread(
+            verify_claims_in_context, claims, context
         )
-        return fallback_answer, verification
+    else:
+        verification = await asyncio.to_thread(
+            verify_answer, answer, context, question, threshold
+        )
+    
+    if not verification["is_grounded"]:
+        return _fallback_answer(context), verification
     
     return answer, verification
 
@@ -171,14 +194,10 @@ List each claim on a new line:
 """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=150
-        )
+        claims_text = complete(prompt, max_tokens=150)
+        if claims_text is None:
+            return [answer]
         
-        claims_text = response.choices[0].message.content.strip()
         claims = [c.strip() for c in claims_text.split('\n') if c.strip() and not c.startswith('#')]
         return claims
     
@@ -214,29 +233,22 @@ Then provide a summary of verification coverage.
 """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=200
-        )
-        
-        verification_text = response.choices[0].message.content.strip()
+        verification_text = complete(prompt, max_tokens=200)
+        if verification_text is None:
+            raise RuntimeError("No LLM available")
         
         # Parse results
         verified = []
         unverified = []
         
-        for line in verification_text.split('\n'):
-            if 'verified' in line.lower():
-                try:
-                    num = int(line.split(':')[0])
-                    if 'verified' in line.lower() and 'unverified' not in line.lower():
-                        verified.append(claims[num-1])
-                    else:
-                        unverified.append(claims[num-1])
-                except:
-                    pass
+        for match in _CLAIM_RESULT_RE.finditer(verification_text):
+            num = int(match.group(1))
+            if not 1 <= num <= len(claims):
+                continue
+            if match.group(2):
+                unverified.append(claims[num-1])
+            else:
+                verified.append(claims[num-1])
         
         coverage = len(verified) / len(claims) if claims else 0
         
@@ -13,37 +13,131 @@ Feedback:
 
 import json
 import hashlib
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional
 
+import numpy as np
+
+# Try to import xxhash (fast non-cryptographic hashing for cache keys)
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
 class AnswerCache:
     """
     Simple caching system for Q&A pairs.
+    
+    Backed by SQLite in WAL mode so a cache hit is a single indexed
+    UPDATE instead of rewriting the whole cache file. Hot questions are
+    also kept in a small in-memory LRU with a TTL; hits served from memory
+    are counted there and written back to SQLite in batches.
     """
     
-    def __init__(self, cache_file: str = "data/answer_cache.json"):
+    def __init__(self, cache_file: str = "data/answer_cache.db",
+                 memory_size: int = 4096, memory_ttl: float = 300):
         self.cache_file = Path(cache_file)
         self.cache_file.parent.mkdir(parents=True, exist_ok=True)
-        self.cache = self._load_cache()
+        self._lock = threading.Lock()
+        self.memory_size = memory_size
+        self.memory_ttl = memory_ttl
+        self._mem = OrderedDict()  # {hash: (expires_at, entry)}
+        self._pending_hits = {}  # {hash: hits not yet written to SQLite}
+        self._conn = sqlite3.connect(
+            str(self.cache_file),
+            isolation_level=None,  # autocommit
+            check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                hash TEXT PRIMARY KEY,
+                question TEXT,
+                answer TEXT,
+                cached_at TEXT,
+                hit_count INTEGER DEFAULT 0,
+                last_accessed TEXT,
+                metadata TEXT,
+                feedback TEXT,
+                embedding BLOB
+            )
+        """)
+        # Caches created before question embeddings were stored
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(cache)")}
+        if "embedding" not in columns:
+            self._conn.execute("ALTER TABLE cache ADD COLUMN embedding BLOB")
+        self._migrate_legacy_json()
     
-    def _load_cache(self) -> Dict:
-        """Load existing cache from file."""
-        if self.cache_file.exists():
-            with open(self.cache_file, 'r') as f:
-                return json.load(f)
-        return {}
+    def _migrate_legacy_json(self):
+        """One-time import of the old JSON cache file, renamed once imported."""
+        legacy_file = self.cache_file.with_suffix(".json")
+        try:
+            with open(legacy_file, 'r') as f:
+                legacy = json.load(f)
+        except FileNotFoundError:
+            return  # Nothing to import, or another worker already did
+        
+        # Re-key by the current question hash; entries already in SQLite win
+        rows = [
+            (
+                self._hash_question(entry["question"]),
+                entry["question"],
+                entry.get("answer"),
+                entry.get("cached_at"),
+                entry.get("hit_count", 0),
+                entry.get("last_accessed"),
+                json.dumps(entry.get("metadata") or {}, default=str, separators=(",", ":")),
+                json.dumps(entry["feedback"]) if entry.get("feedback") is not None else None
+            )
+            for entry in legacy.values()
+            if entry.get("question")
+        ]
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO cache "
+            "(hash, question, answer, cached_at, hit_count, last_accessed, metadata, feedback) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        self._conn.execute("COMMIT")
+        try:
+            legacy_file.rename(legacy_file.with_name(legacy_file.name + ".migrated"))
+        except FileNotFoundError:
+            pass  # Renamed by another worker importing concurrently
     
-    def _save_cache(self):
-        """Save cache to file."""
-        with open(self.cache_file, 'w') as f:
-            json.dump(self.cache, f, indent=2)
+    @staticmethod
+    def _row_to_entry(row: sqlite3.Row) -> Dict:
+        """Convert a cache row into the public entry dict."""
+        entry = {
+            "question": row["question"],
+            "answer": row["answer"],
+            "cached_at": row["cached_at"],
+            "hit_count": row["hit_count"],
+            "metadata": json.loads(row["metadata"]) if row["metadata"] else {},
+            "feedback": json.loads(row["feedback"]) if row["feedback"] else None
+        }
+        if row["last_accessed"]:
+            entry["last_accessed"] = row["last_accessed"]
+        return entry
     
     def _hash_question(self, question: str) -> str:
         """Create unique hash for a question."""
-        # Normalize question (lowercase, remove extra spaces)
-        normalized = " ".join(question.lower().split())
-        return hashlib.md5(normalized.encode()).hexdigest()
+        # Normalize question (lowercase, remove extra spaces).
+        # split()/join() is C-level and measured ~4x faster than a
+        # re.sub(r"\s+") pass (str or bytes) on typical questions.
+        normalized = " ".join(question.lower().split()).encode()
+        # Cache keys don't need a cryptographic hash; both variants give 32 hex chars
+        if XXHASH_AVAILABLE:
+            return xxhash.xxh3_128_hexdigest(normalized)
+        return hashlib.blake2b(normalized, digest_size=16).hexdigest()
     
     def get(self, question: str) -> Optional[Dict]:
         """
@@ -54,17 +148,56 @@ class AnswerCache:
             or None if not cached
         """
         question_hash = self._hash_question(question)
+        now = datetime.now().isoformat()
         
-        if question_hash in self.cache:
-            # Update hit count
-            self.cache[question_hash]["hit_count"] += 1
-            self.cache[question_hash]["last_accessed"] = datetime.now().isoformat()
-            self._save_cache()
-            return self.cache[question_hash]
-        
-        return None
+        with self._lock:
+            # In-memory front cache: no disk access for hot questions
+            cached = self._mem.get(question_hash)
+            if cached is not None and cached[0] > time.monotonic():
+                self._mem.move_to_end(question_hash)
+                entry = cached[1]
+                entry["hit_count"] += 1
+                entry["last_accessed"] = now
+                self._pending_hits[question_hash] = self._pending_hits.get(question_hash, 0) + 1
+                return dict(entry)
+            
+            self._flush_pending_hits()
+            
+            # Update hit count and fetch the entry in one statement
+            row = self._conn.execute(
+                "UPDATE cache SET hit_count = hit_count + 1, last_accessed = ? "
+                "WHERE hash = ? RETURNING *",
+                (now, question_hash)
+            ).fetchone()
+            
+            if row is None:
+                self._mem.pop(question_hash, None)
+                return None
+            
+            entry = self._row_to_entry(row)
+            self._remember(question_hash, entry)
+            return dict(entry)
     
-    def set(self, question: str, answer: str, metadata: Dict = None):
+    def _remember(self, question_hash: str, entry: Dict):
+        """Put an entry in the in-memory LRU (caller holds the lock)."""
+        self._mem[question_hash] = (time.monotonic() + self.memory_ttl, entry)
+        self._mem.move_to_end(question_hash)
+        while len(self._mem) > self.memory_size:
+            self._mem.popitem(last=False)
+    
+    def _flush_pending_hits(self):
+        """Write hit counts served from memory back to SQLite (caller holds the lock)."""
+        if not self._pending_hits:
+            return
+        now = datetime.now().isoformat()
+        self._conn.executemany(
+            "UPDATE cache SET hit_count = hit_count + ?, last_accessed = ? WHERE hash = ?",
+            [(hits, now, question_hash) for question_hash, hits in self._pending_hits.items()]
+        )
+        self._pending_hits.clear()
+    
+    def set(self, question: str, answer: str, metadata: Dict = None,
+            embedding: np.ndarray = None):
         """
         Cache an answer.
         
@@ -72,26 +205,56 @@ class AnswerCache:
             question: User's question
             answer: Generated answer
             metadata: Optional extra info {"chunks_count": 3, "confidence": 0.95}
+            embedding: Optional question embedding, kept so the semantic
+                index can be rebuilt on startup
         """
         question_hash = self._hash_question(question)
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32).tobytes()
         
-        self.cache[question_hash] = {
-            "question": question,
-            "answer": answer,
-            "cached_at": datetime.now().isoformat(),
-            "hit_count": 0,
-            "metadata": metadata or {},
-            "feedback": None
-        }
-        
-        self._save_cache()
+        with self._lock:
+            # A replaced answer starts counting hits from zero again
+            self._pending_hits.pop(question_hash, None)
+            self._mem.pop(question_hash, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache "
+                "(hash, question, answer, cached_at, hit_count, last_accessed, metadata, feedback, embedding) "
+                "VALUES (?, ?, ?, ?, 0, NULL, ?, NULL, ?)",
+                (
+                    question_hash,
+                    question,
+                    answer,
+                    datetime.now().isoformat(),
+                    json.dumps(metadata or {}, default=str, separators=(",", ":")),
+                    embedding
+                )
+            )
+    
+    def get_question_embeddings(self, limit: int) -> list:
+        """
+        (question, embedding) of the most recently cached questions that have
+        an embedding, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question, embedding FROM cache WHERE embedding IS NOT NULL "
+                "ORDER BY cached_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            (row["question"], np.frombuffer(row["embedding"], dtype=np.float32))
+            for row in reversed(rows)
+        ]
     
     def get_cache_stats(self) -> Dict:
         """
         Get statistics about cache usage.
         """
-        total_cached = len(self.cache)
-        total_hits = sum(item.get("hit_count", 0) for item in self.cache.values())
+        with self._lock:
+            self._flush_pending_hits()
+            total_cached, total_hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM cache"
+            ).fetchone()
         
         return {
             "total_cached_questions": total_cached,
@@ -102,8 +265,10 @@ class AnswerCache:
     
     def clear_cache(self):
         """Clear all cached answers."""
-        self.cache = {}
-        self._save_cache()
+        with self._lock:
+            self._mem.clear()
+            self._pending_hits.clear()
+            self._conn.execute("DELETE FROM cache")
 
 
 class FeedbackTracker:
@@ -111,22 +276,48 @@ class FeedbackTracker:
     Track user feedback on answers to improve over time.
     """
     
-    def __init__(self, feedback_file: str = "data/answer_feedback.json"):
+    def __init__(self, feedback_file: str = "data/answer_feedback.jsonl"):
         self.feedback_file = Path(feedback_file)
         self.feedback_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._migrate_legacy_json()
         self.feedback_data = self._load_feedback()
+        # Answer prefixes (first 50 chars) that were rated poorly, for O(1) lookups
+        self.bad_answer_prefixes = {
+            f.get("answer", "")[:50]
+            for f in self.feedback_data["feedbacks"]
+            if f.get("rating", 0) <= 2
+        }
+        # Append-only log: one JSON object per line, line-buffered
+        self._fh = open(self.feedback_file, 'a', buffering=1, encoding='utf-8')
+    
+    def _migrate_legacy_json(self):
+        """One-time import of the old pretty-printed JSON feedback file."""
+        legacy_file = self.feedback_file.with_suffix(".json")
+        if self.feedback_file.exists() or not legacy_file.exists():
+            return
+        
+        with open(legacy_file, 'r') as f:
+            legacy = json.load(f)
+        
+        with open(self.feedback_file, 'w', encoding='utf-8') as f:
+            for entry in legacy.get("feedbacks", []):
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
     
     def _load_feedback(self) -> Dict:
         """Load feedback history."""
+        feedbacks = []
         if self.feedback_file.exists():
-            with open(self.feedback_file, 'r') as f:
-                return json.load(f)
-        return {"feedbacks": [], "stats": {}}
+            with open(self.feedback_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        feedbacks.append(json.loads(line))
+        return {"feedbacks": feedbacks, "stats": {}}
     
-    def _save_feedback(self):
-        """Save feedback to file."""
-        with open(self.feedback_file, 'w') as f:
-            json.dump(self.feedback_data, f, indent=2)
+    def close(self):
+        """Close the feedback log."""
+        with self._lock:
+            self._fh.close()
     
     def add_feedback(self, question: str, answer: str, rating: int, 
                      comment: str = None):
@@ -147,8 +338,11 @@ class FeedbackTracker:
             "comment": comment
         }
         
-        self.feedback_data["feedbacks"].append(feedback_entry)
-        self._save_feedback()
+        with self._lock:
+            self.feedback_data["feedbacks"].append(feedback_entry)
+            if rating <= 2:
+                self.bad_answer_prefixes.add(feedback_entry["answer"][:50])
+            self._fh.write(json.dumps(feedback_entry, separators=(",", ":")) + "\n")
     
     def get_feedback_summary(self) -> Dict:
         """
@@ -163,15 +357,22 @@ class FeedbackTracker:
                 "rating_distribution": {}
             }
         
-        ratings = [f.get("rating", 0) for f in feedbacks]
+        ratings = np.fromiter(
+            (f.get("rating", 0) for f in feedbacks),
+            dtype=np.int64,
+            count=len(feedbacks)
+        )
         
-        rating_dist = {}
-        for rating in ratings:
-            rating_dist[rating] = rating_dist.get(rating, 0) + 1
+        # Count every rating in one pass
+        if ratings.min() >= 0:
+            counts = np.bincount(ratings)
+            rating_dist = {int(r): int(counts[r]) for r in np.flatnonzero(counts)}
+        else:
+            rating_dist = dict(Counter(ratings.tolist()))
         
         return {
             "total_feedback": len(feedbacks),
-            "avg_rating": sum(ratings) / len(ratings),
+            "avg_rating": float(ratings.mean()),
             "rating_distribution": rating_dist,
             "excellent": rating_dist.get(5, 0),
             "good": rating_dist.get(4, 0),
@@ -197,6 +398,64 @@ class FeedbackTracker:
         return high_rated
 
 
+class SemanticQuestionIndex:
+    """
+    In-process similarity index over cached questions, so paraphrases of a
+    cached question can reuse its answer.
+    
+    Embeddings are L2-normalized, so a matrix-vector dot product gives the
+    cosine similarity to every cached question (a flat inner-product index).
+    Holds at most max_size questions; the least recently added are evicted.
+    """
+    
+    def __init__(self, threshold: float = 0.95, max_size: int = 10000):
+        self.threshold = threshold
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._embeddings = None  # (capacity, dim) float32; first len(_questions) rows used
+        self._questions = []
+        self._rows = OrderedDict()  # {normalized question: row}, oldest first
+    
+    def add(self, question: str, embedding: np.ndarray):
+        """Index a cached question under its embedding, replacing any earlier one."""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        key = " ".join(question.lower().split())
+        with self._lock:
+            size = len(self._questions)
+            if key in self._rows:
+                # Re-answered question: overwrite its row
+                row = self._rows.pop(key)
+            elif size >= self.max_size:
+                # Full: reuse the oldest question's row
+                _, row = self._rows.popitem(last=False)
+            else:
+                row = size
+                if self._embeddings is None:
+                    self._embeddings = np.empty((min(64, self.max_size), embedding.size), dtype=np.float32)
+                elif size == len(self._embeddings):
+                    # Grow by doubling so appends stay amortized O(1)
+                    grown = np.empty((min(2 * size, self.max_size), embedding.size), dtype=np.float32)
+                    grown[:size] = self._embeddings
+                    self._embeddings = grown
+                self._questions.append(None)
+            self._embeddings[row] = embedding
+            self._questions[row] = question
+            self._rows[key] = row
+    
+    def lookup(self, embedding: np.ndarray) -> Optional[str]:
+        """Most similar cached question, if its similarity reaches the threshold."""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        with self._lock:
+            size = len(self._questions)
+            if not size:
+                return None
+            similarities = self._embeddings[:size] @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._questions[best]
+            return None
+
+
 class SmartCache:
     """
     Combine caching with feedback for smart decision making.
@@ -205,6 +464,15 @@ class SmartCache:
     def __init__(self):
         self.cache = AnswerCache()
         self.feedback = FeedbackTracker()
+        self.semantic = SemanticQuestionIndex()
+        # Rebuild the paraphrase index from answers cached by earlier runs
+        for question, embedding in self.cache.get_question_embeddings(self.semantic.max_size):
+            self.semantic.add(question, embedding)
+    
+    def _is_well_rated(self, cached: Dict) -> bool:
+        """Check that a cached answer hasn't received negative feedback."""
+        answer_key = cached["answer"][:50]  # Use start of answer as key
+        return answer_key not in self.feedback.bad_answer_prefixes
     
     def should_use_cached_answer(self, question: str) -> bool:
         """
@@ -216,25 +484,37 @@ class SmartCache:
         if not cached:
             return False
         
-        # Check if this cached answer had negative feedback
-        feedbacks = self.feedback.feedback_data.get("feedbacks", [])
-        answer_key = cached["answer"][:50]  # Use start of answer as key
-        
-        for feedback in feedbacks:
-            if feedback.get("answer", "")[:50] == answer_key:
-                if feedback.get("rating", 0) <= 2:
-                    return False  # Don't use poorly-rated cached answer
-        
-        return True
+        return self._is_well_rated(cached)
     
     def get_answer_with_cache(self, question: str):
         """
         Get answer from cache if available and good quality.
         """
-        if self.should_use_cached_answer(question):
-            return self.cache.get(question)
+        cached = self.cache.get(question)
+        if cached and self._is_well_rated(cached):
+            return cached
         return None
     
+    def get_answer_semantic(self, question_embedding: np.ndarray):
+        """
+        Get the cached answer of a similar (paraphrased) question, if any
+        and good quality.
+        """
+        similar_question = self.semantic.lookup(question_embedding)
+        if similar_question is None:
+            return None
+        return self.get_answer_with_cache(similar_question)
+    
+    def save_answer(self, question: str, answer: str, metadata: Dict = None,
+                    question_embedding: np.ndarray = None):
+        """
+        Cache an answer and, given the question's embedding, make it
+        findable by paraphrases too.
+        """
+        self.cache.set(question, answer, metadata, embedding=question_embedding)
+        if question_embedding is not None:
+            self.semantic.add(question, question_embedding)
+    
     def save_answer_with_feedback_prep(self, question: str, answer: str):
         """
         Cache answer and prepare for feedback collection.
@@ -245,3 +525,65 @@ class SmartCache:
             "feedback_ready": True,
             "from_cache": False
         }
+
+
+class EmbeddingCache:
+    """
+    Content-hash -> embedding store, so repeated chunks (headers, footers,
+    re-uploaded documents) are only embedded once.
+    
+    Keys hash the model name together with the exact text; vectors are
+    stored as raw float16 bytes in SQLite (half the size of float32, well
+    within cosine-search tolerance) and handed back as float32.
+    """
+    
+    def __init__(self, model_name: str, cache_file: str = "data/embedding_cache.db"):
+        self.model_name = model_name
+        self.cache_file = Path(cache_file)
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.cache_file),
+            isolation_level=None,  # autocommit
+            check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings_f16 (
+                hash TEXT PRIMARY KEY,
+                embedding BLOB
+            )
+        """)
+    
+    def hash_text(self, text: str) -> str:
+        """Cache key for a text under this model."""
+        data = f"{self.model_name}\x00{text}".encode()
+        if XXHASH_AVAILABLE:
+            return xxhash.xxh3_128_hexdigest(data)
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+    
+    def get_many(self, keys) -> Dict[str, np.ndarray]:
+        """Cached embeddings for the given keys (missing keys are left out)."""
+        found = {}
+        keys = list(set(keys))
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, embedding FROM embeddings_f16 WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        return found
+    
+    def set_many(self, keys, embeddings: np.ndarray):
+        """Store one embedding per key."""
+        embeddings = np.asarray(embeddings, dtype=np.float16)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings_f16 (hash, embedding) VALUES (?, ?)",
+                [(key, emb.tobytes()) for key, emb in zip(keys, embeddings)]
+            )
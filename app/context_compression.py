@@ -14,25 +14,35 @@ Question: "Does the sun provide light?"
 Compressed: "It provides light and heat." (Irrelevant sentences removed!)
 """
 
+import re
+from typing import Iterator
+
 from app.rate_limit import rate_limit
-from app.llm_client import get_available_client
+from app.llm_client import complete, stream_complete
 
-@rate_limit(max_calls=20, time_window=60)
-def compress_context(context: str, question: str, strategy: str = "extract") -> str:
+_CHUNK_MARKER_RE = re.compile(r"^===CHUNK (\d+)===\s*$", re.MULTILINE)
+
+# Max tokens a compressed context may take (the LLM output cap)
+COMPRESSION_TOKEN_BUDGET = 300
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 chars per token, no tokenizer pass."""
+    return len(text) >> 2
+
+
+def should_compress(context: str) -> bool:
     """
-    Compress context by extracting only relevant sentences.
-    
-    Args:
-        context: Full retrieved context
-        question: User question
-        strategy: "extract" (keep relevant sentences) or "summarize" (compress)
-    
-    Returns:
-        Compressed context
+    Whether compressing is worth an LLM call: a context already within
+    ~90% of the compression budget cannot get meaningfully smaller.
     """
-    
+    return estimate_tokens(context) >= COMPRESSION_TOKEN_BUDGET * 0.9
+
+
+def _compression_prompt(context: str, question: str, strategy: str) -> str:
+    """Build the extract/summarize prompt for compress_context."""
     if strategy == "extract":
-        prompt = f"""
+        return f"""
 Extract ONLY the sentences from the context below that are relevant to answering the question.
 Remove any sentences that don't help answer the question.
 Keep the extracted sentences in order.
@@ -45,7 +55,7 @@ Context:
 Extracted context (only relevant sentences):
 """
     else:  # summarize
-        prompt = f"""
+        return f"""
 Summarize the context below in 2-3 sentences, focusing on what's relevant to the question.
 
 Question: {question}
@@ -55,27 +65,65 @@ Context:
 
 Summary:
 """
+
+
+@rate_limit(max_calls=20, time_window=60)
+def compress_context(context: str, question: str, strategy: str = "extract") -> str:
+    """
+    Compress context by extracting only relevant sentences.
+    
+    Args:
+        context: Full retrieved context
+        question: User question
+        strategy: "extract" (keep relevant sentences) or "summarize" (compress)
+    
+    Returns:
+        Compressed context
+    """
+    prompt = _compression_prompt(context, question, strategy)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,  # Be precise
-            max_tokens=300
-        )
-        
-        compressed = response.choices[0].message.content.strip()
-        return compressed
+        compressed = complete(prompt, max_tokens=COMPRESSION_TOKEN_BUDGET)
+        return compressed if compressed is not None else context
     
     except Exception as e:
         print(f"Error compressing context: {e}")
         return context  # Return original if error
 
 
+@rate_limit(max_calls=20, time_window=60)
+def stream_compress_context(context: str, question: str,
+                            strategy: str = "extract") -> Iterator[str]:
+    """
+    Streaming version of compress_context.
+    
+    Yields text pieces as the LLM generates them, so a UI can start
+    rendering after the first token. "".join() the pieces for the full
+    compressed context. Falls back to yielding the original context if
+    no LLM is available or the call fails before producing anything.
+    """
+    prompt = _compression_prompt(context, question, strategy)
+    
+    produced = False
+    try:
+        for piece in stream_complete(prompt, max_tokens=COMPRESSION_TOKEN_BUDGET):
+            produced = True
+            yield piece
+    except Exception as e:
+        print(f"Error compressing context: {e}")
+    
+    if not produced:
+        yield context  # Return original if no LLM / error
+
+
+@rate_limit(max_calls=20, time_window=60)
 def compress_multiple_chunks(chunks: list[str], question: str) -> list[str]:
     """
     Compress multiple chunks for efficiency.
     
+    All chunks go out in ONE prompt with numbered markers, so k chunks
+    cost a single LLM round-trip instead of k.
+    
     Args:
         chunks: List of text chunks
         question: User question
@@ -83,9 +131,46 @@ def compress_multiple_chunks(chunks: list[str], question: str) -> list[str]:
     Returns:
         List of compressed chunks
     """
+    if not chunks:
+        return []
+    
+    numbered = "\n".join(
+        f"===CHUNK {i}===\n{chunk}" for i, chunk in enumerate(chunks, 1)
+    )
+    prompt = f"""
+For each chunk below, extract ONLY the sentences that are relevant to answering the question.
+Remove any sentences that don't help answer the question.
+Keep the extracted sentences in order.
+
+Output every chunk as a line '===CHUNK <number>===' followed by its extracted sentences.
+If nothing in a chunk is relevant, output the marker line with nothing after it.
+
+Question: {question}
+
+{numbered}
+"""
+    
+    try:
+        response_text = complete(prompt, max_tokens=COMPRESSION_TOKEN_BUDGET * len(chunks))
+    except Exception as e:
+        print(f"Error compressing chunks: {e}")
+        response_text = None
+    
+    if response_text is None:
+        return list(chunks)  # Return originals if no LLM / error
+    
+    # Split "===CHUNK i===" sections back into a per-chunk list
+    sections = {}
+    parts = _CHUNK_MARKER_RE.split(response_text)
+    for num, body in zip(parts[1::2], parts[2::2]):
+        sections[int(num)] = body.strip()
+    
+    if not sections:
+        return list(chunks)  # Unparseable response, keep originals
+    
     compressed = []
-    for chunk in chunks:
-        compressed_chunk = compress_context(chunk, question, strategy="extract")
+    for i in range(1, len(chunks) + 1):
+        compressed_chunk = sections.get(i)
         if compressed_chunk:
             compressed.append(compressed_chunk)
     
@@ -97,8 +182,8 @@ def estimate_token_savings(original_context: str, compressed_context: str) -> di
     Estimate cost savings from compression.
     Rough estimate: ~4 chars per token
     """
-    original_tokens = len(original_context) // 4
-    compressed_tokens = len(compressed_context) // 4
+    original_tokens = estimate_tokens(original_context)
+    compressed_tokens = estimate_tokens(compressed_context)
     
     saved = original_tokens - compressed_tokens
     savings_percent = (saved / original_tokens * 100) if original_tokens > 0 else 0
@@ -3,18 +3,11 @@ Demo LLM - Works without OpenAI credits
 Uses retrieved documents to generate demo answers
 """
 
-def generate_demo_answer(question: str, context: str) -> str:
-    """
-    Generate a demo answer based on retrieved context
-    This shows what the system WOULD answer without needing OpenAI
-    """
-    
-    # Extract key information from context
-    lines = context.split('\n')
-    summary = '\n'.join([l.strip() for l in lines if l.strip()])[:500]
-    
-    demo_answers = {
-        "spring framework": f"""Based on your Spring Framework documentation:
+# Answer templates keyed by a phrase to look for in the question, in priority
+# order. Filled in with str.format only for the template that matches, so a
+# request no longer builds every demo answer up front.
+DEMO_ANSWER_TEMPLATES = {
+    "spring framework": """Based on your Spring Framework documentation:
 
 {summary}
 
@@ -25,9 +18,9 @@ Key Points:
 • Used for building scalable applications
 
 Full Context from Your Documents:
-{context[:800]}...""",
-        
-        "architecture": f"""From your Spring Framework documentation:
+{context_800}...""",
+    
+    "architecture": """From your Spring Framework documentation:
 
 {summary}
 
@@ -38,9 +31,10 @@ The Spring Framework provides a comprehensive architecture for:
 • Modular and flexible design
 
 Reference from your documents:
-{context[:600]}...""",
-        
-        "default": f"""Based on the retrieved documents from your uploaded content:
+{context_600}...""",
+}
+
+DEFAULT_DEMO_TEMPLATE = """Based on the retrieved documents from your uploaded content:
 
 {summary}
 
@@ -49,15 +43,32 @@ The system found relevant information and is displaying it here.
 
 Full source:
 {context}"""
-    }
+
+
+def generate_demo_answer(question: str, context: str) -> str:
+    """
+    Generate a demo answer based on retrieved context
+    This shows what the system WOULD answer without needing OpenAI
+    """
     
     # Find best match
     question_lower = question.lower()
-    for key, answer in demo_answers.items():
+    template = DEFAULT_DEMO_TEMPLATE
+    for key, candidate in DEMO_ANSWER_TEMPLATES.items():
         if key in question_lower:
-            return answer
+            template = candidate
+            break
+    
+    # Extract key information from context
+    lines = context.split('\n')
+    summary = '\n'.join([l.strip() for l in lines if l.strip()])[:500]
     
-    return demo_answers["default"]
+    return template.format(
+        summary=summary,
+        context=context,
+        context_800=context[:800],
+        context_600=context[:600]
+    )
 
 
 class DemoLLM:
@@ -1,21 +1,140 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 
-# Try CUDA, fallback to CPU
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Optional INT8 ONNX Runtime backend for CPU-only deployments.
+# Enable with EMBEDDING_BACKEND=onnx (requires: pip install optimum[onnxruntime])
+ONNX_DIR = Path("data/onnx/all-MiniLM-L6-v2-int8")
+ONNX_FILE = "model_quantized.onnx"
+
 try:
-    model = SentenceTransformer(
-        "sentence-transformers/all-MiniLM-L6-v2",
-        device="cuda"
-    )
-except Exception:
-    model = SentenceTransformer(
-        "sentence-transformers/all-MiniLM-L6-v2",
-        device="cpu"
-    )
-
-def embed_texts(texts: list[str]):
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+
+def _load_onnx_model():
+    """
+    Load the INT8-quantized ONNX model, exporting + quantizing it on first use.
+
+    Dynamic quantization with the AVX-512 VNNI config runs the matmuls as
+    int8 dot products on CPUs that support it.
+    """
+    if not (ONNX_DIR / ONNX_FILE).exists():
+        export_dir = ONNX_DIR.parent / "all-MiniLM-L6-v2"
+        ORTModelForFeatureExtraction.from_pretrained(
+            MODEL_NAME, export=True
+        ).save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(ONNX_DIR)
+
+        quantizer = ORTQuantizer.from_pretrained(export_dir)
+        quantizer.quantize(
+            save_dir=ONNX_DIR,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(
+                is_static=False, per_channel=False
+            )
+        )
+
+    ort_model = ORTModelForFeatureExtraction.from_pretrained(ONNX_DIR, file_name=ONNX_FILE)
+    tokenizer = AutoTokenizer.from_pretrained(ONNX_DIR)
+    return ort_model, tokenizer
+
+
+def _onnx_encode(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    """Mean-pooled, L2-normalized embeddings from the ONNX model."""
+    out = np.empty((len(texts), 384), dtype=np.float32)
+
+    # Batch texts of similar length together so padding stays tight,
+    # then scatter the rows back into input order
+    order = np.argsort([len(t) for t in texts], kind="stable")
+
+    for start in range(0, len(texts), batch_size):
+        batch_idx = order[start:start + batch_size]
+        inputs = onnx_tokenizer(
+            [texts[i] for i in batch_idx],
+            padding=True,
+            truncation=True,
+            max_length=256,
+            return_tensors="np"
+        )
+        hidden = np.asarray(onnx_model(**inputs).last_hidden_state)
+
+        # Mean pooling over real tokens only
+        mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+        out[batch_idx] = pooled
+
+    return out
+
+
+def _configure_cpu_threads():
+    """
+    Let CPU inference use all cores via torch intra-op threads (oneDNN/MKL).
+
+    Set EMBEDDING_NUM_THREADS to pin a per-worker thread count when running
+    several server workers on one machine, to avoid oversubscription.
+    """
+    num_threads = int(os.getenv(
+        "EMBEDDING_NUM_THREADS", max(1, (os.cpu_count() or 1) - 1)
+    ))
+    torch.set_num_threads(num_threads)
+    torch.backends.mkldnn.enabled = True
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        pass  # Can only be set before any inter-op parallel work has started
+
+
+model = None
+onnx_model = None
+onnx_tokenizer = None
+
+if os.getenv("EMBEDDING_BACKEND") == "onnx" and ONNX_AVAILABLE:
+    onnx_model, onnx_tokenizer = _load_onnx_model()
+else:
+    # Try CUDA (fp16 matmuls on tensor cores), fallback to CPU
+    try:
+        model = SentenceTransformer(MODEL_NAME, device="cuda")
+        model.half()
+    except Exception:
+        model = SentenceTransformer(MODEL_NAME, device="cpu")
+        _configure_cpu_threads()
+
+def embed_texts(texts: list[str], *, to_numpy: bool = True):
+    """
+    Embed texts with L2-normalized MiniLM vectors.
+
+    Pass to_numpy=False to get a torch.Tensor left on the model's device,
+    so GPU callers doing their own similarity math skip the device->host copy.
+    The ONNX backend is CPU-only and always returns NumPy.
+    """
+    if onnx_model is not None:
+        return _onnx_encode(texts)
+
+    if not to_numpy:
+        return model.encode(
+            texts,
+            batch_size=64,
+            convert_to_tensor=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    # encode() already groups inputs by length internally, so padding is
+    # tight enough for a larger batch size
     return model.encode(
         texts,
-        batch_size=32,
+        batch_size=64,
         convert_to_numpy=True,
-        normalize_embeddings=True
-    )
+        normalize_embeddings=True,
+        show_progress_bar=False
+    ).astype(np.float32, copy=False)
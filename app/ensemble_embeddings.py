@@ -11,47 +11,415 @@ If 2 agree: Good confidence ✓✓
 If only 1: Lower confidence ✓
 
 Real-world: Like asking 3 experts instead of 1!
+
+The models output different sizes (384 / 768 / 1024), so MiniLM and MPNet
+are mapped into BGE's 1024-dim space with linear projections before any
+averaging or comparison. Fit them once with fit_projections() on a sample
+of your documents; they are saved to data/ensemble_projections.npz. Until
+then, only models that already output 1024 dims (BGE) are combined.
 """
 
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import cached_property
+from pathlib import Path
+
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Dict
+import torch
+from typing import List, Dict, Optional
+
+# Optional ONNX Runtime backend (INT8 on CPU).
+# Used automatically on CPU, or on GPU with ENSEMBLE_ORT=1
+# (requires: pip install optimum[onnxruntime])
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+PROJECTION_FILE = "data/ensemble_projections.npz"
+ONNX_DIR = Path("data/onnx")
+
+# Agreement score buckets (a score must be strictly above a bin to reach it)
+AGREEMENT_BINS = np.array([0.7, 0.8, 0.9])
+AGREEMENT_MESSAGES = [
+    "⚠ Low agreement between models (less confident)",
+    "✓ 2 models agree (moderate confidence)",
+    "✓✓ 2+ models agree (confident)",
+    "✓✓✓ All models strongly agree (very confident)",
+]
+SINGLE_MODEL_MESSAGE = "⚠ BGE only (projections not fitted, no agreement check)"
+
+# Output sizes of MiniLM / MPNet / BGE
+MODEL_DIMS = (384, 768, 1024)
+
+# Inputs larger than this go through the multi-process pools (if started)
+MULTI_PROCESS_MIN_TEXTS = 1024
+
+# Batches at least this large are projected/averaged/scored on the GPU
+GPU_COMBINE_MIN_TEXTS = 1024
+
+
+def _pairwise_agreement(common: np.ndarray) -> np.ndarray:
+    """
+    Mean of the pairwise row-wise similarities between the models in common
+    (models x N x dim), for all rows at once. A single model agrees with
+    itself (1.0).
+    
+    Inputs are L2-normalized (encode(normalize_embeddings=True)), so the
+    row-wise dot product is the cosine similarity.
+    """
+    k, n = common.shape[:2]
+    if k < 2:
+        return np.ones(n, dtype=np.float32)
+    pairs = [(i, j) for i in range(k) for j in range(i + 1, k)]
+    return sum(np.einsum("nd,nd->n", common[i], common[j]) for i, j in pairs) / len(pairs)
+
+
+if NUMBA_AVAILABLE:
+    # Average + normalize in one pass per row (the row stays in cache for
+    # the rescale), instead of separate add / scale / norm / divide passes
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _fused_mean_normalize(common, out):
+        k = common.shape[0]
+        n, d = out.shape
+        scale = 1.0 / k
+        for i in numba.prange(n):
+            sum_sq = 0.0
+            for j in range(d):
+                v = 0.0
+                for m in range(k):
+                    v += common[m, i, j]
+                v *= scale
+                out[i, j] = v
+                sum_sq += v * v
+            inv = 1.0 / np.sqrt(sum_sq) if sum_sq > 0.0 else 0.0
+            for j in range(d):
+                out[i, j] *= inv
+
+
+class _OrtEncoder:
+    """
+    ONNX Runtime stand-in for SentenceTransformer.encode().
+    
+    On CPU the model is dynamically quantized to INT8 with the AVX-512 VNNI
+    config; on GPU it runs in FP32 on the CUDA execution provider.
+    """
+    
+    def __init__(self, model_name: str, pooling: str, device: str):
+        self.pooling = pooling
+        quantize = not device.startswith("cuda")
+        model_dir = ONNX_DIR / (model_name.split("/")[-1] + ("-int8" if quantize else ""))
+        file_name = "model_quantized.onnx" if quantize else "model.onnx"
+        
+        if not (model_dir / file_name).exists():
+            export_dir = ONNX_DIR / model_name.split("/")[-1]
+            ORTModelForFeatureExtraction.from_pretrained(
+                model_name, export=True
+            ).save_pretrained(export_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+            
+            if quantize:
+                quantizer = ORTQuantizer.from_pretrained(export_dir)
+                quantizer.quantize(
+                    save_dir=model_dir,
+                    quantization_config=AutoQuantizationConfig.avx512_vnni(
+                        is_static=False, per_channel=False
+                    )
+                )
+                AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+        
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=file_name,
+            provider="CPUExecutionProvider" if quantize else "CUDAExecutionProvider"
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    
+    def encode(self, texts: List[str], batch_size: int = 64, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        """Pooled embeddings, in input order (callers pre-sort by length)."""
+        batches = [np.empty((0, self.model.config.hidden_size), dtype=np.float32)]
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_tensors="np"
+            )
+            hidden = np.asarray(self.model(**inputs).last_hidden_state)
+            
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                # Mean pooling over real tokens only
+                mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            
+            if normalize_embeddings:
+                pooled = pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+            batches.append(pooled.astype(np.float32, copy=False))
+        
+        return np.concatenate(batches)
+
+
+# (model name, pooling used by its sentence-transformers config)
+MODEL_SPECS = [
+    ("sentence-transformers/all-MiniLM-L6-v2", "mean"),
+    ("sentence-transformers/all-mpnet-base-v2", "mean"),
+    ("BAAI/bge-large-en-v1.5", "cls"),
+]
+
 
 class EnsembleEmbedder:
-    def __init__(self, device: str = "cuda"):
+    def __init__(
+        self,
+        device: str = "cuda",
+        projection_file: str = PROJECTION_FILE,
+        cache_size: int = 100_000
+    ):
         """
-        Load 3 different embedding models.
+        Set up the ensemble. The 3 embedding models load on first use
+        (or call prefetch() to load them up front).
         """
-        print("Loading ensemble embedding models...")
-        
-        # Model 1: Fast and good general purpose (your current)
-        self.model1 = SentenceTransformer(
-            "sentence-transformers/all-MiniLM-L6-v2",
-            device=device
+        if device.startswith("cuda") and not torch.cuda.is_available():
+            device = "cpu"
+        self.device = device
+        self.use_ort = ONNX_AVAILABLE and (
+            device == "cpu" or os.getenv("ENSEMBLE_ORT") == "1"
         )
-        print("✓ Loaded MiniLM model")
+        self.model_names = ["MiniLM", "MPNet", "BGE"]
+        self._load_lock = threading.Lock()
         
-        # Model 2: Larger, better semantic understanding
-        self.model2 = SentenceTransformer(
-            "sentence-transformers/all-mpnet-base-v2",
-            device=device
-        )
-        print("✓ Loaded MPNet model")
+        # One worker (and on GPU one CUDA stream) per model so the three
+        # forward passes overlap instead of running back to back
+        self._executor = ThreadPoolExecutor(max_workers=len(MODEL_SPECS))
+        if device.startswith("cuda") and not self.use_ort:
+            self._streams = [torch.cuda.Stream() for _ in MODEL_SPECS]
+        else:
+            self._streams = [None] * len(MODEL_SPECS)
+        
+        # Persistent multi-GPU encoding pools (started with the models)
+        self.pools = None
+        
+        # LRU of already-embedded texts: 8-byte blake2b key -> one fp16 row
+        # holding all three models' vectors back to back (~4.3KB per text)
+        self._cache = OrderedDict()
+        self._cache_max = cache_size
+        self._cache_lock = threading.Lock()
+        self._splits = np.cumsum(MODEL_DIMS)[:-1]
+        
+        # Linear maps MiniLM/MPNet -> BGE space ({"minilm": (384, 1024), "mpnet": (768, 1024)})
+        self.projection_file = Path(projection_file)
+        self.projections = None
+        self._gpu_projections = None
+        if self.projection_file.exists():
+            with np.load(self.projection_file) as data:
+                self.projections = {name: data[name] for name in data.files}
+        else:
+            print(
+                f"⚠️ Ensemble projections not fitted ({self.projection_file}); "
+                "combining BGE only. Call fit_projections(sample_texts) to use all 3 models."
+            )
+    
+    def _load_model(self, index: int):
+        """Load one of the three models on the configured backend."""
+        name, pooling = MODEL_SPECS[index]
+        if self.use_ort:
+            model = _OrtEncoder(name, pooling, self.device)
+        else:
+            model = SentenceTransformer(name, device=self.device)
+            if self.device.startswith("cuda"):
+                model.half()  # fp16 matmuls on tensor cores
+        print(f"✓ Loaded {self.model_names[index]} model")
+        return model
+    
+    @cached_property
+    def model1(self):
+        """Model 1: Fast and good general purpose (your current)"""
+        return self._load_model(0)
+    
+    @cached_property
+    def model2(self):
+        """Model 2: Larger, better semantic understanding"""
+        return self._load_model(1)
+    
+    @cached_property
+    def model3(self):
+        """Model 3: Optimized for dense retrieval"""
+        return self._load_model(2)
+    
+    @cached_property
+    def models(self) -> list:
+        """All 3 models, loaded (and set up) on first access."""
+        with self._load_lock:
+            if "models" in self.__dict__:
+                return self.__dict__["models"]
+            
+            print("Loading ensemble embedding models...")
+            if self.use_ort:
+                print("Using ONNX Runtime backend" + (" (INT8)" if self.device == "cpu" else ""))
+            models = [self.model1, self.model2, self.model3]
+            
+            on_gpu = self.device.startswith("cuda") and not self.use_ort
+            if on_gpu and os.getenv("ENSEMBLE_COMPILE") == "1":
+                self._compile_models(models)
+            
+            # MiniLM and BGE both use BERT's uncased WordPiece vocab, so one
+            # tokenization can feed both (MPNet has its own vocab)
+            self._shared_tokens = not self.use_ort and (
+                self.model1.tokenizer.get_vocab() == self.model3.tokenizer.get_vocab()
+                and getattr(self.model1.tokenizer, "do_lower_case", None)
+                == getattr(self.model3.tokenizer, "do_lower_case", None)
+            )
+            
+            # Persistent multi-GPU encoding pools, one per model, reused across
+            # calls. Only worth their worker processes with more than one GPU.
+            if on_gpu and torch.cuda.device_count() > 1:
+                self.pools = [model.start_multi_process_pool() for model in models]
+                print(f"✓ Started encoding pools on {torch.cuda.device_count()} GPUs")
+            
+            return models
+    
+    def prefetch(self):
+        """Load all 3 models now instead of on the first embedding call."""
+        self.models
+    
+    def _compile_models(self, models: list):
+        """
+        Compile each transformer with torch.compile (CUDA graphs) and warm up.
+        
+        mode="reduce-overhead" replays captured CUDA graphs, removing the
+        per-kernel launch cost that dominates small query batches. Warm-up
+        triggers compilation for the common batch sizes at startup instead
+        of on the first requests.
+        """
+        try:
+            for model in models:
+                transformer = model._first_module()
+                transformer.auto_model = torch.compile(
+                    transformer.auto_model, mode="reduce-overhead"
+                )
+            for batch_size in (1, 8, 32, 64):
+                for model in models:
+                    model.encode([" "] * batch_size, batch_size=64, show_progress_bar=False)
+            print("✓ Compiled ensemble models")
+        except Exception as e:
+            print(f"⚠️ torch.compile failed, running eager: {e}")
+            for model in models:
+                transformer = model._first_module()
+                transformer.auto_model = getattr(
+                    transformer.auto_model, "_orig_mod", transformer.auto_model
+                )
+    
+    def _encode(self, model_idx: int, texts: List[str]) -> np.ndarray:
+        """Encode texts with one model, on that model's CUDA stream if any."""
+        stream = self._streams[model_idx]
+        with torch.cuda.stream(stream) if stream is not None else nullcontext():
+            return self.models[model_idx].encode(
+                texts,
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+    
+    def _encode_features(self, model_idx: int, batches: List[Dict]) -> np.ndarray:
+        """Run one model on already-tokenized batches (skips encode's tokenizing)."""
+        model = self.models[model_idx]
+        stream = self._streams[model_idx]
+        embeddings = [np.empty((0, MODEL_DIMS[model_idx]), dtype=np.float32)]
+        
+        with torch.cuda.stream(stream) if stream is not None else nullcontext(), torch.inference_mode():
+            for features in batches:
+                features = {k: v.to(model.device) for k, v in features.items()}
+                # Both models' pipelines end in a Normalize module, so the
+                # output is already unit length
+                emb = model(features)["sentence_embedding"]
+                embeddings.append(emb.float().cpu().numpy())
         
-        # Model 3: Optimized for dense retrieval
-        self.model3 = SentenceTransformer(
-            "BAAI/bge-large-en-v1.5",
-            device=device
+        return np.concatenate(embeddings)
+    
+    def _truncate_features(self, features: Dict, max_length: int) -> Dict:
+        """Cut BGE's (512-token) encoding down to MiniLM's max length."""
+        if features["input_ids"].shape[1] <= max_length:
+            return features
+        
+        truncated = {k: v[:, :max_length].clone() for k, v in features.items()}
+        # Rows that were cut lost their [SEP]; put it back at the end
+        was_cut = features["attention_mask"][:, max_length:].any(dim=1)
+        truncated["input_ids"][was_cut, -1] = self.model1.tokenizer.sep_token_id
+        return truncated
+    
+    def _encode_multi_process(self, model_idx: int, texts: List[str]) -> np.ndarray:
+        """Encode a large input across all GPUs with the model's persistent pool."""
+        return self.models[model_idx].encode_multi_process(
+            texts, self.pools[model_idx], batch_size=64, normalize_embeddings=True
         )
-        print("✓ Loaded BGE model")
+    
+    def close(self):
+        """Stop the encoding pools and worker threads."""
+        if self.pools is not None:
+            for pool in self.pools:
+                SentenceTransformer.stop_multi_process_pool(pool)
+            self.pools = None
+        self._executor.shutdown(wait=False)
+    
+    def _encode_all_models(self, texts: List[str], indices: tuple = (0, 1, 2)) -> List[np.ndarray]:
+        """Encode texts with the given models (default: all 3), concurrently, in input order."""
+        self.models  # loads the models on first use
         
-        self.models = [self.model1, self.model2, self.model3]
-        self.model_names = ["MiniLM", "MPNet", "BGE"]
+        # Sort by length once for all models so each mini-batch holds
+        # similar-length texts (little padding), then undo the permutation
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        sorted_texts = [texts[i] for i in order]
+        
+        # Large inputs are spread over all GPUs by the persistent pools;
+        # otherwise run the models concurrently in this process
+        if self.pools is not None and len(texts) > MULTI_PROCESS_MIN_TEXTS:
+            encode = self._encode_multi_process
+        else:
+            encode = self._encode
+        
+        jobs = {i: (encode, sorted_texts) for i in indices}
+        if self._shared_tokens and encode is self._encode and 0 in jobs and 2 in jobs:
+            # Tokenize once for BGE and reuse the ids (truncated) for MiniLM
+            bge_batches = [
+                self.model3.tokenize(sorted_texts[i:i + 64])
+                for i in range(0, len(sorted_texts), 64)
+            ]
+            minilm_batches = [
+                self._truncate_features(features, self.model1.max_seq_length)
+                for features in bge_batches
+            ]
+            jobs[0] = (self._encode_features, minilm_batches)
+            jobs[2] = (self._encode_features, bge_batches)
+        
+        futures = [self._executor.submit(fn, i, arg) for i, (fn, arg) in jobs.items()]
+        return [future.result()[inverse] for future in futures]
     
     def embed_texts_all_models(self, texts: List[str]) -> Dict[str, np.ndarray]:
         """
         Embed texts with all 3 models.
         
+        Texts seen recently are served from the in-memory cache; only the
+        rest are encoded.
+        
         Returns:
             {
                 "minilm": [embeddings],
@@ -59,18 +427,161 @@ class EnsembleEmbedder:
                 "bge": [embeddings]
             }
         """
-        embeddings = {}
+        keys = [hashlib.blake2b(t.encode(), digest_size=8).digest() for t in texts]
+        rows = np.empty((len(texts), sum(MODEL_DIMS)), dtype=np.float32)
         
-        for model, name in zip(self.models, self.model_names):
-            emb = model.encode(
-                texts,
-                batch_size=32,
-                convert_to_numpy=True,
-                normalize_embeddings=True
-            )
-            embeddings[name.lower()] = emb
+        # Gather hits; collect each distinct missing text once
+        misses = {}
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    rows[i] = cached
+                else:
+                    misses.setdefault(key, []).append(i)
         
-        return embeddings
+        if misses:
+            miss_texts = [texts[positions[0]] for positions in misses.values()]
+            fresh = np.concatenate(self._encode_all_models(miss_texts), axis=1)
+            
+            with self._cache_lock:
+                for (key, positions), row in zip(misses.items(), fresh):
+                    rows[positions] = row
+                    self._cache[key] = row.astype(np.float16)
+                while len(self._cache) > self._cache_max:
+                    self._cache.popitem(last=False)
+        
+        minilm, mpnet, bge = np.split(rows, self._splits, axis=1)
+        return {"minilm": minilm, "mpnet": mpnet, "bge": bge}
+    
+    def fit_projections(self, texts: List[str], ridge: float = 1e-2) -> Dict:
+        """
+        Fit the MiniLM -> BGE and MPNet -> BGE linear projections.
+        
+        Solves a ridge regression from each model's embeddings to BGE's
+        embeddings of the same texts. Use a few thousand representative
+        chunks; more texts than the model dimension (768) is recommended.
+        
+        Returns:
+            {"minilm": mean cosine fit, "mpnet": mean cosine fit, "texts": N}
+        """
+        embeddings_dict = self.embed_texts_all_models(texts)
+        target = embeddings_dict["bge"].astype(np.float64)
+        
+        projections = {}
+        fit_quality = {}
+        for name in ("minilm", "mpnet"):
+            source = embeddings_dict[name].astype(np.float64)
+            gram = source.T @ source + ridge * np.eye(source.shape[1])
+            projection = np.linalg.solve(gram, source.T @ target).astype(np.float32)
+            projections[name] = projection
+            
+            mapped = source @ projection
+            mapped /= np.linalg.norm(mapped, axis=1, keepdims=True)
+            fit_quality[name] = float(np.mean(np.einsum("nd,nd->n", mapped, target)))
+        
+        self.projections = projections
+        self._gpu_projections = None
+        self.projection_file.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(self.projection_file, **projections)
+        
+        return {**fit_quality, "texts": len(texts)}
+    
+    def _common_models(self) -> List[str]:
+        """
+        Models whose embeddings can be placed in BGE's space: those with a
+        fitted projection, plus those that already output 1024 dims.
+        """
+        projections = self.projections or {}
+        return [
+            name for name, dim in zip(("minilm", "mpnet", "bge"), MODEL_DIMS)
+            if name in projections or dim == MODEL_DIMS[-1]
+        ]
+    
+    def to_common_space(self, embeddings: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Map the models' embeddings into BGE's 1024-dim space.
+        
+        Returns one contiguous (models, N, 1024) array of unit vectors, rows
+        in model order (MiniLM, MPNet, BGE), so the reductions over models
+        walk a single buffer. Without fitted projections only BGE is included.
+        """
+        names = self._common_models()
+        n = len(embeddings["bge"])
+        common = np.empty((len(names), n, MODEL_DIMS[-1]), dtype=np.float32)
+        for i, name in enumerate(names):
+            if name in (self.projections or {}):
+                np.matmul(embeddings[name], self.projections[name], out=common[i])
+                # Projected rows aren't unit length; native ones already are
+                common[i] *= 1.0 / np.sqrt(np.einsum("nd,nd->n", common[i], common[i]))[:, None]
+            else:
+                common[i] = embeddings[name]
+        return common
+    
+    def _combine(self, embeddings: Dict[str, np.ndarray], out: np.ndarray) -> np.ndarray:
+        """
+        Write the normalized ensemble average into out (N x 1024) and return
+        the per-text agreement. Shared by the single and batch entry points.
+        """
+        if (self.device.startswith("cuda") and len(out) >= GPU_COMBINE_MIN_TEXTS
+                and len(self._common_models()) == 3):
+            return self._combine_gpu(embeddings, out)
+        
+        return self._combine_common(self.to_common_space(embeddings), out)
+    
+    def _combine_common(self, common: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """CPU half of _combine, on embeddings already in the (models, N, 1024) space."""
+        if NUMBA_AVAILABLE:
+            # np.asarray: hand numba a plain ndarray view when out is a memmap
+            _fused_mean_normalize(common, np.asarray(out))
+        else:
+            # Average, accumulating straight into the output rows
+            np.sum(common, axis=0, out=out)
+            out *= 1.0 / len(common)
+            
+            # The average of unit vectors isn't unit length: normalize all rows
+            # in one pass, multiplying by the reciprocal norm
+            norms = np.sqrt(np.einsum("nd,nd->n", out, out))[:, None]
+            out *= np.reciprocal(norms, out=np.zeros_like(norms), where=norms > 0)
+        
+        return _pairwise_agreement(common)
+    
+    def _combine_gpu(self, embeddings: Dict[str, np.ndarray], out: np.ndarray) -> np.ndarray:
+        """
+        _combine on the GPU: projection GEMMs, average, normalize and the
+        three pairwise similarities all run as cuBLAS/CUDA kernels; only the
+        native-size embeddings go up and the ensemble rows come back. Needs
+        both projections.
+        """
+        if self._gpu_projections is None:
+            self._gpu_projections = {
+                name: torch.from_numpy(projection).to(self.device)
+                for name, projection in self.projections.items()
+            }
+        
+        def to_gpu(array: np.ndarray) -> torch.Tensor:
+            return torch.from_numpy(np.ascontiguousarray(array)).to(self.device, non_blocking=True)
+        
+        with torch.inference_mode():
+            n = len(out)
+            common = torch.empty((3, n, MODEL_DIMS[-1]), device=self.device)
+            for i, name in enumerate(("minilm", "mpnet")):
+                torch.matmul(to_gpu(embeddings[name]), self._gpu_projections[name], out=common[i])
+            common[2] = to_gpu(embeddings["bge"])
+            common[:2] *= torch.rsqrt((common[:2] * common[:2]).sum(-1, keepdim=True))
+            
+            ensemble = common.sum(0)
+            ensemble *= torch.rsqrt((ensemble * ensemble).sum(-1, keepdim=True)).nan_to_num_(0.0, posinf=0.0)
+            
+            agreement = (
+                (common[0] * common[1]).sum(-1)
+                + (common[0] * common[2]).sum(-1)
+                + (common[1] * common[2]).sum(-1)
+            ) / 3
+            
+            out[:] = ensemble.cpu().numpy()
+            return agreement.cpu().numpy()
     
     def embedding_agreement(self, embeddings: Dict[str, np.ndarray]) -> Dict:
         """
@@ -79,23 +590,8 @@ class EnsembleEmbedder:
         High agreement = confident embeddings
         Low agreement = uncertain embeddings
         """
-        # Calculate pairwise similarities between models
-        minilm = embeddings["minilm"]
-        mpnet = embeddings["mpnet"]
-        bge = embeddings["bge"]
-        
-        # Cosine similarity
-        def cosine_sim(v1, v2):
-            return np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-        
-        similarities = []
-        for i in range(len(minilm)):
-            sim1_2 = cosine_sim(minilm[i], mpnet[i])
-            sim1_3 = cosine_sim(minilm[i], bge[i])
-            sim2_3 = cosine_sim(mpnet[i], bge[i])
-            
-            avg_sim = (sim1_2 + sim1_3 + sim2_3) / 3
-            similarities.append(avg_sim)
+        # Pairwise similarities between models (in BGE space)
+        similarities = _pairwise_agreement(self.to_common_space(embeddings))
         
         return {
             "agreement_scores": similarities,
@@ -117,84 +613,130 @@ class EnsembleEmbedder:
             }
         """
         embeddings_dict = self.embed_texts_all_models([text])
+        ensemble = np.empty((1, 1024), dtype=np.float32)
+        agreement = float(self._combine(embeddings_dict, ensemble)[0])
         
-        # Average the embeddings
-        ensemble = np.mean([
-            embeddings_dict["minilm"],
-            embeddings_dict["mpnet"],
-            embeddings_dict["bge"]
-        ], axis=0)[0]
+        return {
+            "ensemble": ensemble[0],
+            "individual": {name: emb[0] for name, emb in embeddings_dict.items()},
+            "agreement": agreement,
+            "summary": (
+                self._agreement_summary(agreement)
+                if len(self._common_models()) > 1 else SINGLE_MODEL_MESSAGE
+            )
+        }
+    
+    def ensemble_embeddings(
+        self,
+        texts: List[str],
+        output_path: Optional[str] = None,
+        chunk_size: int = 10000
+    ) -> Dict:
+        """
+        Get ensemble embeddings for multiple texts.
         
-        # Normalize
-        ensemble = ensemble / np.linalg.norm(ensemble)
+        Texts are processed chunk_size at a time, so only one chunk's
+        per-model embeddings are held in memory. Pass output_path to write
+        the ensemble rows to a raw float32 memory-mapped file on disk instead
+        of RAM (for very large N); the returned array is then a np.memmap.
         
-        # Get agreement
-        agreement_info = self.embedding_agreement(embeddings_dict)
+        Returns:
+            {
+                "ensemble_embeddings": np.array or np.memmap (N x 1024),
+                "agreement_per_text": [scores],
+                "overall_agreement": float
+            }
+        """
+        n = len(texts)
+        if output_path is not None:
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            ensemble = np.memmap(output_path, dtype=np.float32, mode="w+", shape=(n, 1024))
+        else:
+            ensemble = np.empty((n, 1024), dtype=np.float32)
+        agreement_per_text = np.empty(n, dtype=np.float32)
+        
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            embeddings_dict = self.embed_texts_all_models(texts[start:end])
+            agreement_per_text[start:end] = self._combine(embeddings_dict, ensemble[start:end])
+        
+        if isinstance(ensemble, np.memmap):
+            ensemble.flush()
         
         return {
-            "ensemble": ensemble,
-            "individual": {
-                "minilm": embeddings_dict["minilm"][0],
-                "mpnet": embeddings_dict["mpnet"][0],
-                "bge": embeddings_dict["bge"][0]
-            },
-            "agreement": agreement_info["avg_agreement"],
-            "summary": self._agreement_summary(agreement_info["avg_agreement"])
+            "ensemble_embeddings": ensemble,
+            "agreement_per_text": agreement_per_text,
+            "overall_agreement": np.mean(agreement_per_text)
         }
     
-    def ensemble_embeddings(self, texts: List[str]) -> Dict:
+    def ensemble_embeddings_adaptive(self, texts: List[str], threshold: float = 0.95) -> Dict:
         """
-        Get ensemble embeddings for multiple texts.
+        Like ensemble_embeddings, but skip MPNet where it can't change much.
+        
+        MiniLM (fastest) and BGE (strongest) run first. Texts where they
+        already agree above threshold use the MiniLM/BGE midpoint in MPNet's
+        slot; only the rest are encoded with MPNet. Agreement for the skipped
+        texts is therefore an estimate. Bypasses the text cache. Without
+        fitted projections only BGE is run (and MPNet is skipped for all).
         
         Returns:
             {
                 "ensemble_embeddings": np.array (N x 1024),
                 "agreement_per_text": [scores],
-                "overall_agreement": float
+                "overall_agreement": float,
+                "mpnet_skipped": number of texts not run through MPNet
             }
         """
-        embeddings_dict = self.embed_texts_all_models(texts)
+        n = len(texts)
+        if self._common_models() != ["minilm", "mpnet", "bge"]:
+            (bge,) = self._encode_all_models(texts, indices=(2,))
+            ensemble = np.ascontiguousarray(bge, dtype=np.float32)
+            return {
+                "ensemble_embeddings": ensemble,
+                "agreement_per_text": np.ones(n, dtype=np.float32),
+                "overall_agreement": 1.0,
+                "mpnet_skipped": n
+            }
         
-        # Average
-        ensemble = np.mean([
-            embeddings_dict["minilm"],
-            embeddings_dict["mpnet"],
-            embeddings_dict["bge"]
-        ], axis=0)
-        
-        # Normalize each
-        for i in range(len(ensemble)):
-            ensemble[i] = ensemble[i] / np.linalg.norm(ensemble[i])
-        
-        # Calculate agreement per text
-        agreement_per_text = []
-        for i in range(len(texts)):
-            minilm_i = embeddings_dict["minilm"][i]
-            mpnet_i = embeddings_dict["mpnet"][i]
-            bge_i = embeddings_dict["bge"][i]
-            
-            sim1_2 = np.dot(minilm_i, mpnet_i)
-            sim1_3 = np.dot(minilm_i, bge_i)
-            sim2_3 = np.dot(mpnet_i, bge_i)
-            
-            avg_agreement = (sim1_2 + sim1_3 + sim2_3) / 3
-            agreement_per_text.append(avg_agreement)
+        minilm, bge = (
+            emb.astype(np.float32, copy=False)
+            for emb in self._encode_all_models(texts, indices=(0, 2))
+        )
+        
+        common = np.empty((3, n, MODEL_DIMS[-1]), dtype=np.float32)
+        np.matmul(minilm, self.projections["minilm"], out=common[0])
+        common[0] *= 1.0 / np.sqrt(np.einsum("nd,nd->n", common[0], common[0]))[:, None]
+        common[2] = bge
+        
+        hard = np.flatnonzero(np.einsum("nd,nd->n", common[0], common[2]) < threshold)
+        
+        # Easy texts: midpoint of the two agreeing models
+        np.add(common[0], common[2], out=common[1])
+        common[1] *= 1.0 / np.sqrt(np.einsum("nd,nd->n", common[1], common[1]))[:, None]
+        
+        if len(hard):
+            (mpnet,) = self._encode_all_models([texts[i] for i in hard], indices=(1,))
+            mapped = mpnet.astype(np.float32, copy=False) @ self.projections["mpnet"]
+            common[1][hard] = mapped / np.linalg.norm(mapped, axis=1, keepdims=True)
+        
+        ensemble = np.empty((n, MODEL_DIMS[-1]), dtype=np.float32)
+        agreement_per_text = self._combine_common(common, ensemble)
         
         return {
             "ensemble_embeddings": ensemble,
             "agreement_per_text": agreement_per_text,
-            "overall_agreement": np.mean(agreement_per_text)
+            "overall_agreement": np.mean(agreement_per_text),
+            "mpnet_skipped": n - len(hard)
         }
     
     def _agreement_summary(self, agreement: float) -> str:
         """
         Convert agreement score to human-readable summary.
         """
-        if agreement > 0.9:
-            return "✓✓✓ All models strongly agree (very confident)"
-        elif agreement > 0.8:
-            return "✓✓ 2+ models agree (confident)"
-        elif agreement > 0.7:
-            return "✓ 2 models agree (moderate confidence)"
-        else:
-            return "⚠ Low agreement between models (less confident)"
+        return AGREEMENT_MESSAGES[int(np.digitize(agreement, AGREEMENT_BINS, right=True))]
+    
+    def _agreement_summary_batch(self, scores: np.ndarray) -> List[str]:
+        """
+        Summaries for many agreement scores at once.
+        """
+        return [AGREEMENT_MESSAGES[i] for i in np.digitize(scores, AGREEMENT_BINS, right=True)]
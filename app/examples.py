@@ -89,8 +89,7 @@ def research_paper_analysis():
     
     # Step 3: Build knowledge graph from retrieved papers
     kg = KnowledgeGraph()
-    for chunk in result["all_chunks"]:
-        kg.add_document(chunk, source="research_papers")
+    kg.add_documents(result["all_chunks"], source="research_papers")
     
     # Step 4: Find connections
     entities = kg.find_related_entities("attention mechanism")
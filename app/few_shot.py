@@ -21,8 +21,34 @@ A: ..."
 Result: LLM follows your format, style, and tone!
 """
 
+import logging
+from functools import lru_cache
 from typing import List, Dict
-from app.llm_client import get_available_client
+from app.llm_client import complete
+
+logger = logging.getLogger(__name__)
+
+# Question-type keywords (substring matches), built once
+_COMPARE_WORDS = frozenset({"compare", "difference", "vs", "versus"})
+_SUMMARY_WORDS = frozenset({"summarize", "summary", "overview", "key points"})
+
+
+@lru_cache(maxsize=1024)
+def _classify_question_type(question: str) -> str:
+    """Cached classifier behind FewShotExamples.classify_question_type."""
+    question_lower = question.lower()
+    
+    if question_lower.startswith("what is"):
+        return "definition"
+    elif question_lower.startswith(("how does", "how do", "explain")):
+        return "explanation"
+    elif any(word in question_lower for word in _COMPARE_WORDS):
+        return "comparison"
+    elif any(word in question_lower for word in _SUMMARY_WORDS):
+        return "summary"
+    else:
+        return "general"
+
 
 class FewShotExamples:
     """
@@ -74,18 +100,7 @@ class FewShotExamples:
         """
         Classify question into type: definition, explanation, comparison, summary, etc.
         """
-        question_lower = question.lower()
-        
-        if question_lower.startswith("what is"):
-            return "definition"
-        elif question_lower.startswith(("how does", "how do", "explain")):
-            return "explanation"
-        elif any(word in question_lower for word in ["compare", "difference", "vs", "versus"]):
-            return "comparison"
-        elif any(word in question_lower for word in ["summarize", "summary", "overview", "key points"]):
-            return "summary"
-        else:
-            return "general"
+        return _classify_question_type(question)
     
     @staticmethod
     def get_examples_for_question(question: str) -> List[Dict]:
@@ -93,7 +108,13 @@ class FewShotExamples:
         Get relevant few-shot examples based on question type.
         """
         question_type = FewShotExamples.classify_question_type(question)
-        
+        return FewShotExamples.get_examples_for_type(question_type)
+    
+    @staticmethod
+    def get_examples_for_type(question_type: str) -> List[Dict]:
+        """
+        Get the few-shot examples for a question type.
+        """
         if question_type == "definition":
             return FewShotExamples.DEFINITION_EXAMPLES
         elif question_type == "explanation":
@@ -107,6 +128,24 @@ class FewShotExamples:
             return FewShotExamples.DEFINITION_EXAMPLES[:1] + FewShotExamples.EXPLANATION_EXAMPLES[:1]
 
 
+def _render_examples(examples: List[Dict], question_label: str, answer_label: str) -> str:
+    """Format numbered example blocks in one join."""
+    return "".join(
+        f"Example {i}:\n{question_label}: {example['question']}\n{answer_label}: {example['answer']}\n\n"
+        for i, example in enumerate(examples, 1)
+    )
+
+
+@lru_cache(maxsize=32)
+def _render_examples_block(question_type: str, num_examples: int) -> str:
+    """Header + built-in examples for a question type; they never change."""
+    examples = FewShotExamples.get_examples_for_type(question_type)[:num_examples]
+    return (
+        "You are a helpful AI assistant. Learn from these examples and answer similarly:\n\n"
+        + _render_examples(examples, "Question", "Answer")
+    )
+
+
 def build_few_shot_prompt(question: str, context: str, 
                          num_examples: int = 2) -> str:
     """
@@ -121,26 +160,16 @@ def build_few_shot_prompt(question: str, context: str,
         Complete prompt with examples
     """
     
-    # Get relevant examples
-    examples = FewShotExamples.get_examples_for_question(question)
-    examples = examples[:num_examples]
-    
-    # Build prompt
-    prompt = "You are a helpful AI assistant. Learn from these examples and answer similarly:\n\n"
-    
-    # Add examples
-    for i, example in enumerate(examples, 1):
-        prompt += f"Example {i}:\n"
-        prompt += f"Question: {example['question']}\n"
-        prompt += f"Answer: {example['answer']}\n\n"
+    question_type = FewShotExamples.classify_question_type(question)
+    examples_block = _render_examples_block(question_type, num_examples)
     
-    # Add context and question
-    prompt += "Now, using the context below, answer the user's question in a similar style.\n"
-    prompt += f"Context: {context}\n\n"
-    prompt += f"Question: {question}\n"
-    prompt += "Answer: "
-    
-    return prompt
+    return (
+        f"{examples_block}"
+        "Now, using the context below, answer the user's question in a similar style.\n"
+        f"Context: {context}\n\n"
+        f"Question: {question}\n"
+        "Answer: "
+    )
 
 
 def generate_answer_few_shot(context: str, question: str, 
@@ -162,17 +191,11 @@ def generate_answer_few_shot(context: str, question: str,
     prompt = build_few_shot_prompt(question, context, num_examples)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=temperature,
-            max_tokens=500
-        )
-        
-        return response.choices[0].message.content.strip()
+        # Shared, process-wide client from app.llm_client
+        return complete(prompt, max_tokens=500, temperature=temperature) or ""
     
-    except Exception as e:
-        print(f"Error generating answer: {e}")
+    except Exception:
+        logger.exception("Error generating few-shot answer")
         return ""
 
 
@@ -188,6 +211,8 @@ class CustomFewShotExamples:
         self.examples_file = Path(examples_file)
         self.examples_file.parent.mkdir(parents=True, exist_ok=True)
         self.examples = self._load_examples()
+        # (category, num_examples, examples in category) -> rendered block
+        self._rendered = {}
     
     def _load_examples(self) -> Dict:
         """Load custom examples."""
@@ -203,7 +228,7 @@ class CustomFewShotExamples:
         import json
         
         with open(self.examples_file, 'w') as f:
-            json.dump(self.examples, f, indent=2)
+            json.dump(self.examples, f, separators=(",", ":"))
     
     def add_example(self, category: str, question: str, answer: str):
         """
@@ -234,22 +259,24 @@ class CustomFewShotExamples:
         Build prompt using custom examples from a category.
         """
         examples = self.get_examples_for_category(category)
-        examples = examples[:num_examples]
         
         if not examples:
             # Fall back to standard few-shot
             return build_few_shot_prompt(question, context, num_examples)
         
-        # Build prompt with custom examples
-        prompt = f"You are answering {category} questions. Learn from these examples:\n\n"
+        # The category's length in the key invalidates it after add_example
+        key = (category, num_examples, len(examples))
+        examples_block = self._rendered.get(key)
+        if examples_block is None:
+            examples_block = (
+                f"You are answering {category} questions. Learn from these examples:\n\n"
+                + _render_examples(examples[:num_examples], "Q", "A")
+            )
+            self._rendered[key] = examples_block
         
-        for i, example in enumerate(examples, 1):
-            prompt += f"Example {i}:\n"
-            prompt += f"Q: {example['question']}\n"
-            prompt += f"A: {example['answer']}\n\n"
-        
-        prompt += f"Context: {context}\n\n"
-        prompt += f"Question: {question}\n"
-        prompt += "Answer: "
-        
-        return prompt
+        return (
+            f"{examples_block}"
+            f"Context: {context}\n\n"
+            f"Question: {question}\n"
+            "Answer: "
+        )
@@ -3,8 +3,14 @@ Groq LLM Integration - Free API (14,400 requests/day)
 No credits needed, just sign up at https://console.groq.com/keys
 """
 
+import json
+import logging
 import os
-from typing import Optional
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
 
 # Try to import groq
 try:
@@ -13,6 +19,35 @@ try:
 except ImportError:
     GROQ_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+
+
+# One keep-alive connection pool for all HuggingFace / Ollama calls
+# (pooling only: no retries, so a generation POST is never sent twice)
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
+
+@lru_cache(maxsize=1)
+def _groq_configured() -> bool:
+    return GROQ_AVAILABLE and os.getenv("GROQ_API_KEY") is not None
+
+
+@lru_cache(maxsize=1)
+def _hf_configured() -> bool:
+    return os.getenv("HF_API_KEY") is not None
+
+
+@lru_cache(maxsize=1)
+def _ollama_running() -> bool:
+    try:
+        response = _SESSION.get("http://localhost:11434/api/tags", timeout=2)
+        return response.status_code == 200
+    except:
+        return False
+
 
 class GroqLLM:
     """
@@ -35,9 +70,9 @@ class GroqLLM:
         self.client = Groq(api_key=api_key)
         self.model = "llama-3.3-70b-versatile"  # Free fast model
     
-    def answer_question(self, question: str, context: str) -> dict:
-        """Generate answer using Groq"""
-        
+    @staticmethod
+    def _messages(question: str, context: str) -> list:
+        """Chat messages for a question over retrieved context"""
         system_prompt = """You are a helpful AI assistant answering questions based on provided documents.
         
 Use the context to answer the question. If the answer is not in the context, say so.
@@ -50,12 +85,16 @@ Context from documents:
 
 Answer the question based on the context above."""
         
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def answer_question(self, question: str, context: str) -> dict:
+        """Generate answer using Groq"""
         try:
             response = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self._messages(question, context),
                 model=self.model,
                 max_tokens=1000,
                 temperature=0.7,
@@ -80,10 +119,28 @@ Answer the question based on the context above."""
                 "provider": "Groq (Free)"
             }
     
+    def answer_question_stream(self, question: str, context: str) -> Iterator[str]:
+        """Yield the Groq answer in pieces as tokens arrive"""
+        try:
+            stream = self.client.chat.completions.create(
+                messages=self._messages(question, context),
+                model=self.model,
+                max_tokens=1000,
+                temperature=0.7,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        
+        except Exception as e:
+            logger.exception("Groq streaming error")
+            yield f"Error: {str(e)}"
+    
     @staticmethod
     def is_configured() -> bool:
-        """Check if Groq is properly configured"""
-        return GROQ_AVAILABLE and os.getenv("GROQ_API_KEY") is not None
+        """Check if Groq is properly configured (checked once per process)"""
+        return _groq_configured()
 
 
 class HuggingFaceLLM:
@@ -106,8 +163,6 @@ class HuggingFaceLLM:
     def answer_question(self, question: str, context: str) -> dict:
         """Generate answer using Hugging Face"""
         try:
-            import requests
-            
             api_url = f"https://api-inference.huggingface.co/models/{self.model_id}"
             headers = {"Authorization": f"Bearer {self.api_key}"}
             
@@ -118,7 +173,7 @@ Context:
 
 Answer:"""
             
-            response = requests.post(
+            response = _SESSION.post(
                 api_url,
                 headers=headers,
                 json={"inputs": prompt, "parameters": {"max_new_tokens": 500}}
@@ -148,8 +203,8 @@ Answer:"""
     
     @staticmethod
     def is_configured() -> bool:
-        """Check if HF is configured"""
-        return os.getenv("HF_API_KEY") is not None
+        """Check if HF is configured (checked once per process)"""
+        return _hf_configured()
 
 
 class OllamaLLM:
@@ -161,9 +216,8 @@ class OllamaLLM:
     def __init__(self):
         """Initialize Ollama client"""
         try:
-            import requests
             # Test if Ollama is running
-            response = requests.get("http://localhost:11434/api/tags", timeout=2)
+            response = _SESSION.get("http://localhost:11434/api/tags", timeout=2)
             if response.status_code != 200:
                 raise ConnectionError("Ollama not running on localhost:11434")
         except Exception as e:
@@ -176,23 +230,24 @@ class OllamaLLM:
         self.base_url = "http://localhost:11434"
         self.model = "mistral"
     
-    def answer_question(self, question: str, context: str) -> dict:
-        """Generate answer using local Ollama"""
-        try:
-            import requests
-            
-            prompt = f"""Question: {question}
+    @staticmethod
+    def _prompt(question: str, context: str) -> str:
+        """Prompt for a question over retrieved context"""
+        return f"""Question: {question}
 
 Context:
 {context}
 
 Answer based on the context:"""
-            
-            response = requests.post(
+    
+    def answer_question(self, question: str, context: str) -> dict:
+        """Generate answer using local Ollama"""
+        try:
+            response = _SESSION.post(
                 f"{self.base_url}/api/generate",
                 json={
                     "model": self.model,
-                    "prompt": prompt,
+                    "prompt": self._prompt(question, context),
                     "stream": False,
                     "temperature": 0.7
                 },
@@ -221,44 +276,78 @@ Answer based on the context:"""
                 "provider": "Ollama (Local - Free)"
             }
     
+    def answer_question_stream(self, question: str, context: str) -> Iterator[str]:
+        """Yield the Ollama answer in pieces as tokens arrive"""
+        try:
+            with _SESSION.post(
+                f"{self.base_url}/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": self._prompt(question, context),
+                    "stream": True,
+                    "temperature": 0.7
+                },
+                stream=True,
+                timeout=60
+            ) as response:
+                response.raise_for_status()
+                # One JSON object per line until "done"
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+        
+        except Exception as e:
+            logger.exception("Ollama streaming error")
+            yield f"Error: {str(e)}"
+    
     @staticmethod
     def is_configured() -> bool:
-        """Check if Ollama is running"""
-        try:
-            import requests
-            response = requests.get("http://localhost:11434/api/tags", timeout=2)
-            return response.status_code == 200
-        except:
-            return False
+        """Check if Ollama is running (probed once per process)"""
+        return _ollama_running()
 
 
+@lru_cache(maxsize=1)
 def get_free_llm():
     """
     Try to get a configured free LLM in order of preference:
     1. Groq (fastest, recommended)
     2. Ollama (if running locally)
     3. Hugging Face (if token available)
+    
+    The chosen client is created once and reused for every question.
+    Call invalidate_llm_cache() after changing keys or starting Ollama.
     """
     
     # Try Groq first
     if GroqLLM.is_configured():
         try:
             return GroqLLM(), "Groq"
-        except Exception as e:
-            print(f"⚠️ Groq error: {e}")
+        except Exception:
+            logger.exception("Groq error")
     
     # Try Ollama
     if OllamaLLM.is_configured():
         try:
             return OllamaLLM(), "Ollama"
-        except Exception as e:
-            print(f"⚠️ Ollama error: {e}")
+        except Exception:
+            logger.exception("Ollama error")
     
     # Try Hugging Face
     if HuggingFaceLLM.is_configured():
         try:
             return HuggingFaceLLM(), "HuggingFace"
-        except Exception as e:
-            print(f"⚠️ HuggingFace error: {e}")
+        except Exception:
+            logger.exception("HuggingFace error")
     
     return None, None
+
+
+def invalidate_llm_cache():
+    """Forget cached configuration probes and the chosen free LLM."""
+    for cached in (_groq_configured, _hf_configured, _ollama_running, get_free_llm):
+        cached.cache_clear()
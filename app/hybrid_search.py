@@ -7,67 +7,274 @@ Why?
 - Keyword: Great for exact matches ("Python error" matches "Python error")
 """
 
-from rank_bm25 import BM25Okapi
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 from app.embeddings import embed_texts
 from app.vectordb import query_chunks
 import numpy as np
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# BM25Okapi defaults (same scoring as the rank_bm25 package)
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+# On-disk BM25 postings, reused across restarts while the corpus is unchanged
+BM25_INDEX_DIR = "data/bm25_index"
+BM25_ARRAYS = ("term_offsets", "post_docs", "post_tfs", "idf", "doc_norms")
+
+
+def reciprocal_rank_fusion(ranked_lists, k: int = 60, top_k: int = None):
+    """
+    Merge ranked chunk lists with Reciprocal Rank Fusion: each chunk scores
+    sum(1 / (k + rank)) over the lists it appears in (rank starts at 1).
+    
+    Returns chunks by fused score, best first (ties keep first-seen order).
+    """
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, chunk in enumerate(ranked, 1):
+            scores[chunk] = scores.get(chunk, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=scores.__getitem__, reverse=True)
+    return fused[:top_k] if top_k else fused
+
+
+def _corpus_fingerprint(chunks, chunk_ids) -> str:
+    """Hash of chunk ids + texts; a saved index is only reused if it matches."""
+    h = hashlib.blake2b(digest_size=16)
+    for chunk_id, chunk in zip(chunk_ids, chunks):
+        h.update(f"{chunk_id}\x00{chunk}\x00".encode())
+    h.update(str(len(chunks)).encode())
+    return h.hexdigest()
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, nogil=True)
+    def _bm25_scores(query_ids, idf, term_offsets, post_docs, post_tfs, doc_norms, out):
+        """
+        Accumulate BM25 scores over the postings of each query term.
+        
+        Only documents containing a query term are touched, so a query
+        costs O(matching postings) instead of O(docs x query terms).
+        """
+        out[:] = 0.0
+        for q in query_ids:
+            weight = idf[q]
+            for p in range(term_offsets[q], term_offsets[q + 1]):
+                d = post_docs[p]
+                tf = post_tfs[p]
+                out[d] += weight * tf * (BM25_K1 + 1.0) / (tf + doc_norms[d])
+
+
 class HybridSearcher:
     def __init__(self):
-        self.bm25 = None
         self.all_chunks = []
         self.chunk_ids = []
+        
+        # BM25 index: postings (CSR by term id), idf and doc length norms
+        self.vocab = {}
+        self.idf = None
+        self.term_offsets = None
+        self.post_docs = None
+        self.post_tfs = None
+        self.doc_norms = None
     
-    def index_documents(self, chunks, chunk_ids):
+    def index_documents(self, chunks, chunk_ids, index_dir: str = BM25_INDEX_DIR):
         """
         Build BM25 index from chunks.
         Called during ingestion.
+        
+        The index saved in index_dir is memory-mapped instead of rebuilt
+        when it was built from the same chunks.
         """
         self.all_chunks = chunks
         self.chunk_ids = chunk_ids
         
+        fingerprint = _corpus_fingerprint(chunks, chunk_ids)
+        if self.load_index(index_dir, fingerprint):
+            print(f"✓ Loaded BM25 index for {len(chunks)} chunks from {index_dir}")
+            return
+        
         # Tokenize for BM25 (split into words)
-        tokenized_chunks = [chunk.lower().split() for chunk in chunks]
-        self.bm25 = BM25Okapi(tokenized_chunks)
+        self._build_postings([chunk.lower().split() for chunk in chunks])
+        self.save_index(index_dir, fingerprint)
         
         print(f"✓ Indexed {len(chunks)} chunks for BM25 keyword search")
     
-    def semantic_search(self, question, top_k=8):
+    def _build_postings(self, tokenized_chunks):
         """
-        Traditional embedding-based search.
+        Build the BM25 index as flat arrays: per-term postings (doc ids and
+        term frequencies, CSR by term id), idf, and per-doc length norms.
+        Scores match rank_bm25's BM25Okapi.
         """
-        query_embedding = embed_texts([question])[0]
-        results = query_chunks(query_embedding, top_k=top_k)
+        vocab = {}
+        terms, docs, tfs = [], [], []
+        doc_lens = np.empty(len(tokenized_chunks), dtype=np.float32)
+        
+        for doc_id, tokens in enumerate(tokenized_chunks):
+            doc_lens[doc_id] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                terms.append(vocab.setdefault(token, len(vocab)))
+                docs.append(doc_id)
+                tfs.append(tf)
+        
+        terms = np.asarray(terms, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        df = np.bincount(terms, minlength=len(vocab))
         
-        semantic_results = {}
-        for doc, dist in zip(results["documents"][0], results["distances"][0]):
-            similarity = 1 - dist  # Convert distance to similarity
-            semantic_results[doc] = similarity
+        self.vocab = vocab
+        self.term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=self.term_offsets[1:])
+        self.post_docs = np.asarray(docs, dtype=np.int32)[order]
+        self.post_tfs = np.asarray(tfs, dtype=np.float32)[order]
         
-        return semantic_results
+        # BM25Okapi idf: negative values are floored at epsilon * mean idf
+        n_docs = len(tokenized_chunks)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = BM25_EPSILON * idf.mean()
+        self.idf = idf.astype(np.float32)
+        
+        avgdl = doc_lens.mean() if n_docs else 1.0
+        self.doc_norms = BM25_K1 * (1 - BM25_B + BM25_B * doc_lens / avgdl)
     
-    def keyword_search(self, question, top_k=8):
+    def save_index(self, index_dir: str = BM25_INDEX_DIR, fingerprint: str = ""):
+        """Write the postings arrays (.npy, mmap-able) and vocab to index_dir."""
+        path = Path(index_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        def replace(file_name, write):
+            # Write aside and rename, so processes that still have the old
+            # file memory-mapped keep reading the old (unlinked) copy
+            tmp = path / f"{file_name}.tmp"
+            with open(tmp, "wb") as f:
+                write(f)
+            os.replace(tmp, path / file_name)
+        
+        for name in BM25_ARRAYS:
+            replace(f"{name}.npy", lambda f: np.save(f, getattr(self, name)))
+        replace("vocab.json", lambda f: f.write(
+            json.dumps(list(self.vocab), separators=(",", ":")).encode()
+        ))
+        # Written last: the fingerprint only matches once all arrays are in place
+        replace("meta.json", lambda f: f.write(json.dumps(
+            {"fingerprint": fingerprint, "num_chunks": len(self.all_chunks)}
+        ).encode()))
+    
+    def load_index(self, index_dir: str = BM25_INDEX_DIR, fingerprint: str = None) -> bool:
         """
-        BM25 keyword-based search.
-        Great for exact phrase matching.
+        Memory-map a saved index. Returns False if there is none, or if
+        fingerprint is given and the index was built from other chunks.
         """
-        if self.bm25 is None:
-            return {}
+        path = Path(index_dir)
+        try:
+            with open(path / "meta.json") as f:
+                meta = json.load(f)
+            if fingerprint is not None and meta["fingerprint"] != fingerprint:
+                return False
+            
+            arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in BM25_ARRAYS}
+            with open(path / "vocab.json") as f:
+                vocab = {token: i for i, token in enumerate(json.load(f))}
+        except (OSError, ValueError, KeyError):
+            return False
         
-        tokenized_question = question.lower().split()
-        scores = self.bm25.get_scores(tokenized_question)
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.vocab = vocab
+        return True
+    
+    def _keyword_scores(self, tokenized_question):
+        """BM25 score of every chunk for the tokenized question."""
+        # Repeated query terms count once per occurrence, as in rank_bm25;
+        # unknown terms score 0
+        query_ids = np.array(
+            [self.vocab[t] for t in tokenized_question if t in self.vocab],
+            dtype=np.int32
+        )
+        scores = np.empty(len(self.all_chunks), dtype=np.float32)
+        
+        if NUMBA_AVAILABLE:
+            _bm25_scores(
+                query_ids, self.idf, self.term_offsets,
+                self.post_docs, self.post_tfs, self.doc_norms, scores
+            )
+            return scores
+        
+        # Same accumulation vectorized per query term: a term's postings
+        # hold each document once, so a fancy-indexed += is safe
+        scores[:] = 0.0
+        for q in query_ids:
+            start, end = self.term_offsets[q], self.term_offsets[q + 1]
+            docs = self.post_docs[start:end]
+            tfs = self.post_tfs[start:end]
+            scores[docs] += self.idf[q] * tfs * (BM25_K1 + 1.0) / (tfs + self.doc_norms[docs])
+        return scores
+    
+    def semantic_search_arrays(self, question, top_k=8, query_embedding=None):
+        """
+        Embedding-based search as (chunks, similarities) arrays.
+        Pass query_embedding if the question is already embedded.
+        """
+        if query_embedding is None:
+            query_embedding = embed_texts([question])[0]
+        results = query_chunks(query_embedding, top_k=top_k)
+        
+        # Convert distance to similarity
+        similarities = 1 - np.asarray(results["distances"][0], dtype=np.float64)
+        return results["documents"][0], similarities
+    
+    def semantic_search(self, question, top_k=8, query_embedding=None):
+        """
+        Traditional embedding-based search.
+        """
+        chunks, similarities = self.semantic_search_arrays(
+            question, top_k=top_k, query_embedding=query_embedding
+        )
+        return dict(zip(chunks, similarities.tolist()))
+    
+    def keyword_search_arrays(self, question, top_k=8):
+        """
+        BM25 keyword search as (chunks, scores) arrays, best first.
+        Only chunks with a positive score are returned.
+        """
+        if self.idf is None:
+            return [], np.empty(0)
         
-        # Get top_k by score
-        top_indices = np.argsort(scores)[-top_k:][::-1]
+        tokenized_question = question.lower().split()
+        scores = self._keyword_scores(tokenized_question)
         
-        keyword_results = {}
-        for idx in top_indices:
-            if idx < len(self.all_chunks) and scores[idx] > 0:
-                keyword_results[self.all_chunks[idx]] = float(scores[idx])
+        # Get top_k by score: O(N) partition, then sort only those k
+        if top_k < len(scores):
+            top_indices = np.argpartition(scores, -top_k)[-top_k:]
+        else:
+            top_indices = np.arange(len(scores))
+        top_indices = top_indices[np.argsort(scores[top_indices])[::-1]]
+        top_indices = top_indices[
+            (top_indices < len(self.all_chunks)) & (scores[top_indices] > 0)
+        ]
         
-        return keyword_results
+        return [self.all_chunks[i] for i in top_indices], scores[top_indices].astype(np.float64)
+    
+    def keyword_search(self, question, top_k=8):
+        """
+        BM25 keyword-based search.
+        Great for exact phrase matching.
+        """
+        chunks, scores = self.keyword_search_arrays(question, top_k=top_k)
+        return dict(zip(chunks, scores.tolist()))
     
-    def hybrid_search(self, question, semantic_weight=0.6, keyword_weight=0.4, top_k=8):
+    def hybrid_search(self, question, semantic_weight=0.6, keyword_weight=0.4, top_k=8,
+                      query_embedding=None):
         """
         Combine semantic and keyword search.
         
@@ -76,40 +283,38 @@ class HybridSearcher:
             semantic_weight: How much to trust embeddings (0-1)
             keyword_weight: How much to trust keywords (0-1)
             top_k: Return top k results
+            query_embedding: Embedding of question, if already computed
         
         Returns:
             List of (chunk, combined_score) sorted by score
         """
-        # Get results from both methods
-        semantic_results = self.semantic_search(question, top_k=top_k)
-        keyword_results = self.keyword_search(question, top_k=top_k)
-        
-        # Normalize scores to 0-1 range for fair combination
-        all_chunks_scored = {}
-        
-        # Add semantic results
-        if semantic_results:
-            max_semantic = max(semantic_results.values())
-            for chunk, score in semantic_results.items():
-                normalized_score = score / max_semantic if max_semantic > 0 else 0
-                all_chunks_scored[chunk] = semantic_weight * normalized_score
-        
-        # Add keyword results
-        if keyword_results:
-            max_keyword = max(keyword_results.values())
-            for chunk, score in keyword_results.items():
-                normalized_score = score / max_keyword if max_keyword > 0 else 0
-                # If chunk already exists, add to it; otherwise create new entry
-                if chunk in all_chunks_scored:
-                    all_chunks_scored[chunk] += keyword_weight * normalized_score
-                else:
-                    all_chunks_scored[chunk] = keyword_weight * normalized_score
-        
-        # Sort by combined score
-        hybrid_results = sorted(
-            all_chunks_scored.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
+        # Get results from both methods concurrently: the embedding + ANN
+        # query runs in a worker while BM25 scores here (both release the GIL)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            semantic_future = executor.submit(
+                self.semantic_search_arrays, question, top_k, query_embedding
+            )
+            keyword_chunks, keyword = self.keyword_search_arrays(question, top_k=top_k)
+            semantic_chunks, semantic = semantic_future.result()
+        
+        # Position of each distinct chunk (semantic first, then keyword-only)
+        positions = {}
+        semantic_pos = [positions.setdefault(c, len(positions)) for c in semantic_chunks]
+        keyword_pos = [positions.setdefault(c, len(positions)) for c in keyword_chunks]
+        if not positions:
+            return []
+        
+        # Normalize each method by its best score for fair combination
+        # (a method whose best score isn't positive contributes 0)
+        combined = np.zeros(len(positions))
+        for pos, scores, weight in (
+            (semantic_pos, semantic, semantic_weight),
+            (keyword_pos, keyword, keyword_weight),
+        ):
+            if len(scores) and scores.max() > 0:
+                combined[pos] += weight * (scores / scores.max())
         
-        return hybrid_results[:top_k]
+        # Sort by combined score (stable: ties keep semantic-first order)
+        chunks = list(positions)
+        order = np.argsort(-combined, kind="stable")[:top_k]
+        return [(chunks[i], float(combined[i])) for i in order]
@@ -1,49 +1,151 @@
-import nltk
-from PyPDF2 import PdfReader
-from nltk.tokenize import sent_tokenize
-from app.embeddings import embed_texts
-from app.vectordb import add_chunks
+import os
+import re
+from functools import lru_cache
 
-# Download NLTK punkt tokenizer
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+import numpy as np
+from app.caching import EmbeddingCache
+from app.embeddings import MODEL_NAME, embed_texts
+from app.pdf_extract import iter_page_texts
+from app.vectordb import add_chunks, discard_chunks, flush_chunks
 
+# Sentence splitting for chunking: blingfire (native) if installed,
+# otherwise a regex. Set SENTENCE_SPLITTER=nltk to use NLTK Punkt instead
+# (slower, better with abbreviations; only matters near chunk edges).
 try:
-    nltk.data.find('tokenizers/punkt_tab')
-except LookupError:
-    nltk.download('punkt_tab')
+    from blingfire import text_to_sentences
+    BLINGFIRE_AVAILABLE = True
+except ImportError:
+    BLINGFIRE_AVAILABLE = False
 
-def semantic_chunk(text, max_tokens=500):
-    sentences = sent_tokenize(text)
-    chunks, current = [], ""
+SENTENCE_SPLITTER = os.getenv("SENTENCE_SPLITTER", "blingfire" if BLINGFIRE_AVAILABLE else "regex")
+
+_SENT_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'])')
+
+@lru_cache(maxsize=1)
+def _ensure_nltk():
+    """Make sure the Punkt data is present; runs once, on first NLTK use."""
+    import nltk
+
+    # A deployment that sets NLTK_DATA has provisioned the models already,
+    # so skip walking nltk.data.path
+    if os.getenv("NLTK_DATA"):
+        return
+
+    # Download NLTK punkt tokenizer
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt')
+
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        nltk.download('punkt_tab')
+
+@lru_cache(maxsize=1)
+def _punkt_tokenizer():
+    """
+    Load the English Punkt model once and call it directly, instead of
+    going through sent_tokenize's per-call language/model lookup.
+    """
+    _ensure_nltk()
+    import nltk
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer  # NLTK >= 3.8.2 (punkt_tab)
+        return PunktTokenizer("english")
+    except ImportError:
+        return nltk.data.load('tokenizers/punkt/english.pickle')
+
+def split_sentences(text):
+    """Split text into non-empty sentences with the configured splitter."""
+    if SENTENCE_SPLITTER == "nltk":
+        sentences = _punkt_tokenizer().tokenize(text)
+    elif SENTENCE_SPLITTER == "blingfire":
+        sentences = text_to_sentences(text).split("\n")
+    else:
+        sentences = _SENT_RE.split(text)
+    return [s for s in sentences if s and not s.isspace()]
+
+EMBED_BATCH_SIZE = 64
+
+_embedding_cache = EmbeddingCache(MODEL_NAME)
+
+def _embed_with_cache(chunks):
+    """Embed chunks, reusing stored embeddings for text already seen."""
+    keys = [_embedding_cache.hash_text(chunk) for chunk in chunks]
+    cached = _embedding_cache.get_many(keys)
+
+    # Embed each distinct missing text once
+    missing = {}
+    for chunk, key in zip(chunks, keys):
+        if key not in cached:
+            missing.setdefault(key, chunk)
+    if missing:
+        new_embeddings = embed_texts(list(missing.values()))
+        _embedding_cache.set_many(missing.keys(), new_embeddings)
+        cached.update(zip(missing.keys(), new_embeddings))
+
+    return np.stack([cached[key] for key in keys])
+
+
+def semantic_chunk_iter(sentences, max_tokens=500):
+    """Yield chunks of up to max_tokens words as sentences stream in."""
+    # Sentences are collected and joined once per chunk, rather than
+    # growing a string with += (quadratic in the chunk length)
+    current, current_tokens = [], 0
 
     for sent in sentences:
-        if len((current + sent).split()) > max_tokens:
-            chunks.append(current.strip())
-            current = sent
+        # Running word count: each sentence is split once, not the whole chunk
+        sent_tokens = len(sent.split())
+        if current_tokens + sent_tokens > max_tokens and current_tokens:
+            yield " ".join(current).strip()
+            current, current_tokens = [sent], sent_tokens
         else:
-            current += " " + sent
+            current.append(sent)
+            current_tokens += sent_tokens
 
     if current:
-        chunks.append(current.strip())
+        yield " ".join(current).strip()
 
-    return chunks
+def semantic_chunk(text, max_tokens=500):
+    return list(semantic_chunk_iter(split_sentences(text), max_tokens))
 
-def process_document(file_path: str):
+def _iter_sentences(file_path: str):
+    """Sentences of a document, page by page for PDFs (no full-text join)."""
     if file_path.endswith(".pdf"):
-        reader = PdfReader(file_path)
-        text = " ".join(p.extract_text() for p in reader.pages)
+        for page_text in iter_page_texts(file_path):
+            yield from split_sentences(page_text)
     else:
         with open(file_path, "r", encoding="utf-8") as f:
-            text = f.read()
+            yield from split_sentences(f.read())
+
+def process_document(file_path: str):
+    # Embed and store chunks in batches as they are produced, so at most
+    # one vectordb write batch of chunks/embeddings is held in memory
+    batch, start_index = [], 0
 
-    chunks = semantic_chunk(text)
-    embeddings = embed_texts(chunks)
+    try:
+        for chunk in semantic_chunk_iter(_iter_sentences(file_path)):
+            batch.append(chunk)
+            if len(batch) == EMBED_BATCH_SIZE:
+                add_chunks(
+                    chunks=batch,
+                    embeddings=_embed_with_cache(batch),
+                    source=file_path,
+                    start_index=start_index
+                )
+                start_index += len(batch)
+                batch = []
 
-    add_chunks(
-        chunks=chunks,
-        embeddings=embeddings,
-        source=file_path
-    )
+        if batch:
+            add_chunks(
+                chunks=batch,
+                embeddings=_embed_with_cache(batch),
+                source=file_path,
+                start_index=start_index
+            )
+    except Exception:
+        # Don't let a half-processed document ride along with the next one
+        discard_chunks(file_path)
+        raise
+    flush_chunks()
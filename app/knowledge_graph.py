@@ -12,12 +12,81 @@ Relations:
 Why? When you search for Newton, you get all related concepts!
 """
 
+import atexit
+import hashlib
+import heapq
 import json
+import os
+from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 from app.rate_limit import rate_limit
 from app.llm_client import get_available_client
 
+# Try to import orjson (native JSON parser/encoder for graph loads and saves)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Documents per LLM call in add_documents()
+KG_EXTRACT_BATCH_SIZE = 8
+
+
+# Texts shorter than this with no capitalized word after the first are
+# extracted as empty without calling the LLM
+TRIVIAL_TEXT_CHARS = 50
+
+
+def _empty_extraction() -> Dict:
+    return {"entities": [], "relations": []}
+
+
+def _is_trivial(text: str) -> bool:
+    """Short text with no likely names (capitalized words past the first)."""
+    return len(text) < TRIVIAL_TEXT_CHARS and not any(
+        word[:1].isupper() for word in text.split()[1:]
+    )
+
+
+def _dumps_line(record) -> bytes:
+    """One compact JSON line (orjson if available)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+
+# Model per backend for extraction calls
+EXTRACTION_MODELS = {"openai": "gpt-4o-mini", "groq": "llama-3.3-70b-versatile"}
+
+
+def _chat_json(llm_config: Dict, prompt: str, max_tokens: int) -> str:
+    """One JSON-mode chat completion on the shared OpenAI/Groq client."""
+    response = llm_config["client"].chat.completions.create(
+        model=EXTRACTION_MODELS[llm_config["type"]],
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.3,
+        max_tokens=max_tokens,
+        response_format={"type": "json_object"}
+    )
+    return response.choices[0].message.content.strip()
+
+
+def _parse_json(response_text: str):
+    """
+    Parse an LLM JSON reply. Replies are requested in JSON mode; for
+    backends without it, fall back to the outermost {...} span.
+    """
+    try:
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        start, end = response_text.find("{"), response_text.rfind("}")
+        if start != -1 and end > start:
+            return json.loads(response_text[start:end + 1])
+        return None
+
 class KnowledgeGraph:
     """
     Build and query knowledge graphs from documents.
@@ -26,27 +95,153 @@ class KnowledgeGraph:
     def __init__(self, graph_file: str = "data/knowledge_graph.json"):
         self.graph_file = Path(graph_file)
         self.graph_file.parent.mkdir(parents=True, exist_ok=True)
-        self.entities = {}  # {entity: [related entities]}
-        self.relations = []  # [(entity1, relation, entity2)]
+        # Relations live in an append-only log next to the entities file
+        self.relations_file = self.graph_file.with_name(self.graph_file.stem + "_relations.jsonl")
+        # LLM extractions by text hash, so re-ingested text skips the LLM
+        self.extract_cache_file = self.graph_file.with_name("extract_cache.jsonl")
+        self._extract_cache = {}  # {text hash: extraction}
+        self._pending_extractions = []  # [(text hash, extraction)] not yet saved
+        self.entities = {}  # {entity: {"sources": [...], "occurrences": n}}
+        
+        # Entity, relation and source names are interned once; relations
+        # refer to them by id
+        self._id2name = []  # [name]
+        self._name2id = {}  # {name: id}
+        self.relations = []  # [(entity1_id, relation_id, entity2_id, source_id)]
+        self._adj = defaultdict(list)  # {entity_id: [(relation, neighbor_id)]}
+        self._relation_keys = set()  # {(entity1_id, relation_id, entity2_id)}
+        
+        # Changes are saved by flush() (or on exit), not on every add_document;
+        # relations before _saved_relations are already in the log
+        self._dirty = False
+        self._saved_relations = 0
         self._load_graph()
+        atexit.register(self.flush)
+        
+        # Per-graph memo of traversals; cleared whenever relations change
+        self._related_ids = lru_cache(maxsize=1024)(self._related_ids)
+        self._path_ids = lru_cache(maxsize=1024)(self._path_ids)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+    
+    def flush(self):
+        """Save the graph and extraction cache if anything changed since the last save."""
+        if self._pending_extractions:
+            with open(self.extract_cache_file, 'ab') as f:
+                for record in self._pending_extractions:
+                    f.write(_dumps_line(record))
+            self._pending_extractions = []
+        if self._dirty:
+            self._save_graph()
+            self._dirty = False
     
     def _load_graph(self):
         """Load existing knowledge graph."""
+        loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+        
+        data = {}
         if self.graph_file.exists():
-            with open(self.graph_file, 'r') as f:
-                data = json.load(f)
-                self.entities = data.get("entities", {})
-                self.relations = data.get("relations", [])
+            raw = self.graph_file.read_bytes()
+            data = loads(raw)
+            del raw  # only the parsed objects are kept from here on
+            self.entities = data.pop("entities", {})
+        
+        # One [entity1, relation, entity2, source] record per line
+        if self.relations_file.exists():
+            with open(self.relations_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        self._add_relation(tuple(self._intern(name) for name in loads(line)))
+        self._saved_relations = logged = len(self.relations)
+        
+        # Graphs saved before the relations log kept relations inline (as
+        # dicts, or as ids into "names"); they move to the log on the next
+        # flush. Skip any an interrupted flush already logged.
+        names = data.pop("names", [])
+        for relation in data.pop("relations", []):
+            if isinstance(relation, dict):
+                relation = self._intern_relation(relation, relation.get("source"))
+            else:
+                relation = tuple(self._intern(names[i]) for i in relation)
+            if logged and relation[:3] in self._relation_keys:
+                continue
+            self._add_relation(relation)
+        self._dirty = len(self.relations) > logged
+        
+        # One [text hash, extraction] record per line
+        if self.extract_cache_file.exists():
+            with open(self.extract_cache_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        key, extracted = loads(line)
+                        self._extract_cache[key] = extracted
+    
+    def _intern(self, name) -> int:
+        """Id of a name in the shared name pool, adding it if new."""
+        name_id = self._name2id.get(name)
+        if name_id is None:
+            name_id = self._name2id[name] = len(self._id2name)
+            self._id2name.append(name)
+        return name_id
+    
+    def _intern_relation(self, relation: Dict, source) -> tuple:
+        """Relation dict -> (entity1_id, relation_id, entity2_id, source_id)."""
+        return (
+            self._intern(relation.get("entity1")),
+            self._intern(relation.get("relation")),
+            self._intern(relation.get("entity2")),
+            self._intern(source)
+        )
+    
+    def _relation_dict(self, relation: tuple) -> Dict:
+        """Public dict form of an interned relation."""
+        names = self._id2name
+        return {
+            "entity1": names[relation[0]],
+            "relation": names[relation[1]],
+            "entity2": names[relation[2]],
+            "source": names[relation[3]]
+        }
+    
+    def _add_relation(self, relation: tuple):
+        """Append an interned relation and index it."""
+        self.relations.append(relation)
+        self._index_relation(relation)
+    
+    def _index_relation(self, relation: tuple):
+        """Add a relation to the adjacency index under both of its entities."""
+        entity1, _, entity2, _ = relation
+        self._relation_keys.add(relation[:3])
+        self._adj[entity1].append((relation, entity2))
+        if entity2 != entity1:
+            self._adj[entity2].append((relation, entity1))
     
     def _save_graph(self):
-        """Save knowledge graph to file."""
-        with open(self.graph_file, 'w') as f:
-            json.dump({
-                "entities": self.entities,
-                "relations": self.relations
-            }, f, indent=2)
+        """
+        Append relations added since the last save to the relations log,
+        then rewrite the entities file atomically (orjson if available).
+        """
+        names = self._id2name
+        new_relations = self.relations[self._saved_relations:]
+        if new_relations:
+            with open(self.relations_file, 'ab') as f:
+                for relation in new_relations:
+                    f.write(_dumps_line([names[i] for i in relation]))
+            self._saved_relations = len(self.relations)
+        
+        data = {"entities": self.entities}
+        tmp_file = self.graph_file.with_suffix(".json.tmp")
+        if ORJSON_AVAILABLE:
+            tmp_file.write_bytes(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_file, self.graph_file)
     
-    @rate_limit(max_calls=15, time_window=60)
     def extract_entities_and_relations(self, text: str) -> Dict:
         """
         Extract entities and their relationships from text using LLM.
@@ -60,7 +255,38 @@ class KnowledgeGraph:
                 ]
             }
         """
+        if _is_trivial(text):
+            return _empty_extraction()
+        
+        key = self._extract_key(text)
+        cached = self._extract_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # Without an LLM there is nothing to extract (and no rate-limit slot to spend)
+        llm_config = get_available_client()
+        if not llm_config["client"]:
+            return _empty_extraction()
         
+        extracted = self._extract_entities_and_relations(llm_config, text)
+        if extracted is None:
+            return _empty_extraction()
+        self._remember_extraction(key, extracted)
+        return extracted
+    
+    @staticmethod
+    def _extract_key(text: str) -> str:
+        """Extraction cache key for a text."""
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    
+    def _remember_extraction(self, key: str, extracted: Dict):
+        """Cache an LLM extraction (saved to disk on the next flush)."""
+        self._extract_cache[key] = extracted
+        self._pending_extractions.append((key, extracted))
+    
+    @rate_limit(max_calls=15, time_window=60)
+    def _extract_entities_and_relations(self, llm_config: Dict, text: str) -> Optional[Dict]:
+        """LLM extraction for one text; None if the call or parsing failed."""
         prompt = f"""
 Extract all named entities and their relationships from this text.
 
@@ -81,37 +307,110 @@ Return ONLY the JSON, nothing else.
 """
         
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=300
+            response_text = _chat_json(llm_config, prompt, max_tokens=300)
+            data = _parse_json(response_text)
+            return data if isinstance(data, dict) else None
+        
+        except Exception as e:
+            print(f"Error extracting entities: {e}")
+            return None
+    
+    def extract_entities_and_relations_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        Extract entities and relations from several texts in one LLM call.
+        
+        Returns one {"entities": [...], "relations": [...]} dict per text,
+        in order (empty for any text the LLM skipped).
+        """
+        results = [None] * len(texts)
+        
+        # Only texts that are neither trivial nor cached go to the LLM
+        pending = []
+        for i, text in enumerate(texts):
+            if _is_trivial(text):
+                results[i] = _empty_extraction()
+            else:
+                key = self._extract_key(text)
+                results[i] = self._extract_cache.get(key)
+                if results[i] is None:
+                    pending.append((i, key))
+        
+        llm_config = get_available_client()
+        if pending and llm_config["client"]:
+            extracted = self._extract_entities_and_relations_batch(
+                llm_config, [texts[i] for i, _ in pending]
             )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            # Parse JSON
-            try:
-                data = json.loads(response_text)
-                return data
-            except json.JSONDecodeError:
-                # Try to extract JSON from response
-                import re
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group())
-                return {"entities": [], "relations": []}
+            for (i, key), item in zip(pending, extracted):
+                if item is not None:
+                    results[i] = item
+                    self._remember_extraction(key, item)
+        
+        return [result if result is not None else _empty_extraction() for result in results]
+    
+    @rate_limit(max_calls=15, time_window=60)
+    def _extract_entities_and_relations_batch(self, llm_config: Dict, texts: List[str]) -> List[Optional[Dict]]:
+        """LLM extraction for several texts, in order; None where a text got no usable answer."""
+        documents = "\n---\n".join(texts)
+        prompt = f"""
+Extract all named entities and their relationships from each of the {len(texts)} documents below.
+Documents are separated by lines containing only ---.
+
+{documents}
+
+For ENTITIES: List important names, concepts, places (e.g., "Isaac Newton", "Calculus")
+For RELATIONS: List how entities are connected (e.g., "invented", "discovered", "caused")
+
+Format your response as JSON, with one object per document, in the same order:
+{{
+    "documents": [
+        {{
+            "entities": ["entity1", "entity2", ...],
+            "relations": [
+                {{"entity1": "...", "relation": "...", "entity2": "..."}}
+            ]
+        }}
+    ]
+}}
+
+Return ONLY the JSON, nothing else.
+"""
+        
+        results = []
+        try:
+            response_text = _chat_json(llm_config, prompt, max_tokens=min(300 * len(texts), 4000))
+            data = _parse_json(response_text)
+            if isinstance(data, dict):
+                data = data.get("documents")
+            if isinstance(data, list):
+                results = [item if isinstance(item, dict) else None for item in data[:len(texts)]]
         
         except Exception as e:
             print(f"Error extracting entities: {e}")
-            return {"entities": [], "relations": []}
+        
+        return results
     
     def add_document(self, text: str, source: str = "unknown"):
         """
         Add document to knowledge graph by extracting and storing entities/relations.
         """
-        extracted = self.extract_entities_and_relations(text)
-        
+        return self._add_extracted(self.extract_entities_and_relations(text), source)
+    
+    def add_documents(self, texts: List[str], source: str = "unknown",
+                      batch_size: int = KG_EXTRACT_BATCH_SIZE) -> Dict:
+        """
+        Add many documents, extracting batch_size of them per LLM call.
+        """
+        totals = {"entities_added": 0, "relations_added": 0}
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            for extracted in self.extract_entities_and_relations_batch(batch):
+                added = self._add_extracted(extracted, source)
+                totals["entities_added"] += added["entities_added"]
+                totals["relations_added"] += added["relations_added"]
+        return totals
+    
+    def _add_extracted(self, extracted: Dict, source: str) -> Dict:
+        """Store one extraction result's entities and relations."""
         # Add entities
         for entity in extracted.get("entities", []):
             if entity not in self.entities:
@@ -124,16 +423,23 @@ Return ONLY the JSON, nothing else.
                     self.entities[entity]["sources"].append(source)
                 self.entities[entity]["occurrences"] += 1
         
-        # Add relations
+        # Add relations, skipping triples the graph already has
+        relations_added = 0
         for relation in extracted.get("relations", []):
-            relation["source"] = source
-            self.relations.append(relation)
+            relation = self._intern_relation(relation, source)
+            if relation[:3] in self._relation_keys:
+                continue
+            self._add_relation(relation)
+            relations_added += 1
         
-        self._save_graph()
+        if relations_added:
+            self._related_ids.cache_clear()
+            self._path_ids.cache_clear()
+        self._dirty = True
         
         return {
             "entities_added": len(extracted.get("entities", [])),
-            "relations_added": len(extracted.get("relations", []))
+            "relations_added": relations_added
         }
     
     def find_related_entities(self, entity: str, max_distance: int = 2) -> Dict:
@@ -155,37 +461,43 @@ Return ONLY the JSON, nothing else.
         if entity not in self.entities:
             return {"entity": entity, "found": False}
         
+        entity_id = self._name2id.get(entity, -1)  # -1: no relations yet
+        
         # Find direct relations
         direct_relations = [
-            r for r in self.relations
-            if r.get("entity1") == entity or r.get("entity2") == entity
+            self._relation_dict(relation) for relation, _ in self._adj.get(entity_id, ())
         ]
         
-        # Find related entities
-        related = set()
-        for relation in direct_relations:
-            if relation.get("entity1") == entity:
-                related.add(relation.get("entity2"))
-            else:
-                related.add(relation.get("entity1"))
-        
-        # Find second-level relations if max_distance > 1
-        if max_distance > 1:
-            for related_entity in list(related):
-                for relation in self.relations:
-                    if relation.get("entity1") == related_entity:
-                        related.add(relation.get("entity2"))
-                    elif relation.get("entity2") == related_entity:
-                        related.add(relation.get("entity1"))
-        
         return {
             "entity": entity,
             "found": True,
             "direct_relations": direct_relations,
-            "related_entities": list(related),
+            "related_entities": [self._id2name[i] for i in self._related_ids(entity_id, max_distance)],
             "sources": self.entities.get(entity, {}).get("sources", [])
         }
     
+    def _related_ids(self, entity_id: int, max_distance: int) -> tuple:
+        """Ids within max_distance hops of entity_id, nearest first (memoized)."""
+        adj_get = self._adj.get  # bound once for the loops below
+        
+        # Breadth-first, one hop per level: each entity is expanded at most
+        # once, and related entities come out nearest first
+        visited = {entity_id}
+        related = []
+        frontier = [entity_id]
+        for _ in range(max_distance):
+            next_frontier = []
+            for current in frontier:
+                for _, neighbor in adj_get(current, ()):
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        next_frontier.append(neighbor)
+            related.extend(next_frontier)
+            frontier = next_frontier
+            if not frontier:
+                break
+        return tuple(related)
+    
     def find_path_between_entities(self, entity1: str, entity2: str) -> List:
         """
         Find shortest path between two entities in the knowledge graph.
@@ -196,35 +508,68 @@ Return ONLY the JSON, nothing else.
             Returns: ["Isaac Newton", "--discovered-->", "Laws of Motion", 
                      "--explains-->", "Gravity"]
         """
-        # Simple BFS path finding
-        from collections import deque
+        if entity1 == entity2:
+            return [entity1]
+        
+        # Search over name ids; unknown names have no relations
+        path = self._path_ids(self._name2id.get(entity1, -1), self._name2id.get(entity2, -2))
+        return [self._id2name[i] for i in path]
+    
+    def _path_ids(self, start: int, target: int) -> tuple:
+        """Shortest path start -> target as alternating entity/relation ids (memoized)."""
+        if start not in self._adj or target not in self._adj:
+            return ()  # No path found
         
-        visited = set()
-        queue = deque([(entity1, [entity1])])
+        # Bidirectional BFS: grow the smaller side one level at a time until
+        # the two searches meet. parents map node -> (previous node toward
+        # that side's root, relation id, hops from root)
+        parents_fwd = {start: (None, None, 0)}
+        parents_bwd = {target: (None, None, 0)}
+        fwd, bwd = [start], [target]
         
-        while queue:
-            current, path = queue.popleft()
-            
-            if current == entity2:
-                return path
-            
-            if current in visited:
-                continue
-            visited.add(current)
+        while fwd and bwd:
+            if len(fwd) <= len(bwd):
+                fwd, meetings = self._expand_level(fwd, parents_fwd, parents_bwd)
+            else:
+                bwd, meetings = self._expand_level(bwd, parents_bwd, parents_fwd)
             
-            # Find neighbors
-            for relation in self.relations:
-                if relation.get("entity1") == current:
-                    neighbor = relation.get("entity2")
-                    if neighbor not in visited:
-                        queue.append((neighbor, path + [relation.get("relation"), neighbor]))
+            if meetings:
+                meet = min(meetings, key=lambda n: parents_fwd[n][2] + parents_bwd[n][2])
                 
-                elif relation.get("entity2") == current:
-                    neighbor = relation.get("entity1")
-                    if neighbor not in visited:
-                        queue.append((neighbor, path + [relation.get("relation"), neighbor]))
+                # start ... meet, walked back from meet and reversed
+                head = [meet]
+                node = meet
+                while parents_fwd[node][0] is not None:
+                    node, relation_id, _ = parents_fwd[node]
+                    head += [relation_id, node]
+                
+                # meet ... target
+                tail = []
+                node = meet
+                while parents_bwd[node][0] is not None:
+                    node, relation_id, _ = parents_bwd[node]
+                    tail += [relation_id, node]
+                
+                return tuple(head[::-1] + tail)
         
-        return []  # No path found
+        return ()  # No path found
+    
+    def _expand_level(self, frontier: List[int], parents: Dict, other_parents: Dict):
+        """
+        Expand one BFS level; returns the next frontier and the newly reached
+        nodes the other search has already seen.
+        """
+        adj_get = self._adj.get  # bound once for the loop below
+        next_frontier, meetings = [], []
+        for current in frontier:
+            hops = parents[current][2] + 1
+            for relation, neighbor in adj_get(current, ()):
+                if neighbor not in parents:
+                    parents[neighbor] = (current, relation[1], hops)
+                    next_frontier.append(neighbor)
+                    if neighbor in other_parents:
+                        meetings.append(neighbor)
+        return next_frontier, meetings
     
     def query_by_entity(self, entity: str) -> Dict:
         """
@@ -237,9 +582,9 @@ Return ONLY the JSON, nothing else.
         return {
             "total_entities": len(self.entities),
             "total_relations": len(self.relations),
-            "top_entities": sorted(
+            "top_entities": heapq.nlargest(
+                10,
                 self.entities.items(),
-                key=lambda x: x[1].get("occurrences", 0),
-                reverse=True
-            )[:10]
+                key=lambda x: x[1].get("occurrences", 0)
+            )
         }
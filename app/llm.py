@@ -1,53 +1,81 @@
-import os
-from typing import Optional
+from typing import Iterator, Optional
+from app.llm_client import get_available_client
 
 def generate_answer(context, question):
     """Generate answer using available LLM (OpenAI, Groq, or Demo)"""
     
-    # Try OpenAI first
-    if os.getenv("OPENAI_API_KEY"):
-        return _generate_with_openai(context, question)
+    # Shared, process-wide client (OpenAI first, then Groq), so every
+    # answer reuses the same keep-alive connection pool
+    llm_config = get_available_client()
     
-    # Try Groq (free alternative)
-    if os.getenv("GROQ_API_KEY"):
-        return _generate_with_groq(context, question)
+    if llm_config["type"] == "openai":
+        return _generate_with_openai(llm_config["client"], context, question)
+    
+    # Groq (free alternative)
+    if llm_config["type"] == "groq":
+        return _generate_with_groq(llm_config["client"], context, question)
     
     # Fall back to demo mode
     return _generate_demo_answer(context, question)
 
 
-def _generate_with_openai(context: str, question: str) -> str:
-    """Generate answer using OpenAI"""
-    from openai import OpenAI
+def generate_answer_stream(context, question) -> Iterator[str]:
+    """Streaming counterpart of generate_answer(): yields text pieces as they arrive"""
+    llm_config = get_available_client()
     
-    client = OpenAI()
-    prompt = f"""
-Answer ONLY using the context below.
-If the answer is not present, say you do not know.
+    if llm_config["type"] == "openai":
+        stream = llm_config["client"].chat.completions.create(
+            model="gpt-4o-mini",
+            messages=_openai_messages(context, question),
+            temperature=0.2,
+            stream=True
+        )
+    elif llm_config["type"] == "groq":
+        system_prompt, user_prompt = _groq_prompts(context, question)
+        stream = llm_config["client"].chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            max_tokens=1024,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            stream=True
+        )
+    else:
+        yield _generate_demo_answer(context, question)
+        return
+    
+    for event in stream:
+        if event.choices and event.choices[0].delta.content:
+            yield event.choices[0].delta.content
 
-Context:
-{context}
 
-Question:
-{question}
-"""
+# Static instructions first (system message), then the question, then the
+# context: repeated calls for one question (e.g. recursive retrieval) share
+# the longest possible prompt prefix
+OPENAI_SYSTEM_PROMPT = """Answer ONLY using the context provided by the user.
+If the answer is not present, say you do not know."""
 
+
+def _openai_messages(context: str, question: str) -> list[dict]:
+    return [
+        {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Question:\n{question}\n\nContext:\n{context}"}
+    ]
+
+
+def _generate_with_openai(client, context: str, question: str) -> str:
+    """Generate answer using OpenAI"""
     response = client.chat.completions.create(
         model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+        messages=_openai_messages(context, question),
         temperature=0.2
     )
 
     return response.choices[0].message.content
 
 
-def _generate_with_groq(context: str, question: str) -> str:
-    """Generate answer using Groq (free)"""
-    from groq import Groq
-    
-    api_key = os.getenv("GROQ_API_KEY")
-    client = Groq(api_key=api_key)
-    
+def _groq_prompts(context: str, question: str) -> tuple[str, str]:
     system_prompt = """You are a helpful AI assistant answering questions based on provided documents.
 Use the context to answer the question. If the answer is not in the context, say so.
 Be concise but informative."""
@@ -58,15 +86,22 @@ Context from documents:
 {context}
 
 Please provide a helpful answer based on the context above."""
+    return system_prompt, user_prompt
+
 
-    message = client.messages.create(
+def _generate_with_groq(client, context: str, question: str) -> str:
+    """Generate answer using Groq (free)"""
+    system_prompt, user_prompt = _groq_prompts(context, question)
+    response = client.chat.completions.create(
         model="llama-3.3-70b-versatile",
         max_tokens=1024,
-        system=system_prompt,
-        messages=[{"role": "user", "content": user_prompt}]
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
     )
     
-    return message.content[0].text
+    return response.choices[0].message.content
 
 
 def _generate_demo_answer(context: str, question: str) -> str:
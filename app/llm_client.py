@@ -4,7 +4,8 @@ Automatically falls back from OpenAI -> Groq -> Demo mode.
 """
 
 import os
-from typing import Optional
+from functools import lru_cache
+from typing import Iterator, Optional
 
 
 def get_openai_client():
@@ -31,12 +32,16 @@ def get_groq_client():
     return None
 
 
+@lru_cache(maxsize=1)
 def get_available_client():
     """
     Get the first available LLM client:
     1. OpenAI (if OPENAI_API_KEY set)
     2. Groq (if GROQ_API_KEY set)
     3. None (will use demo/fallback mode)
+    
+    The client is created once and shared (both SDK clients are thread-safe),
+    so every caller reuses the same HTTP connection pool.
     """
     client = get_openai_client()
     if client:
@@ -47,3 +52,80 @@ def get_available_client():
         return {"type": "groq", "client": client}
     
     return {"type": "none", "client": None}
+
+
+def close_available_client():
+    """Close the shared LLM client (call on shutdown)."""
+    if get_available_client.cache_info().currsize:
+        client = get_available_client()["client"]
+        if client is not None and hasattr(client, "close"):
+            client.close()
+    get_available_client.cache_clear()
+
+
+def complete(prompt: str, max_tokens: int, temperature: float = 0.2,
+             json_mode: bool = False, system: Optional[str] = None) -> Optional[str]:
+    """
+    Run a single-prompt completion on the first available LLM.
+    
+    json_mode asks OpenAI for a guaranteed JSON object reply (the prompt
+    must mention JSON). system is an optional system message; keep static
+    instructions there so requests share a cacheable prefix. Returns the
+    stripped response text, or None if no LLM is configured.
+    """
+    llm_config = get_available_client()
+    
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+    
+    if llm_config["type"] == "openai":
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = llm_config["client"].chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **extra
+        )
+        return response.choices[0].message.content.strip()
+    
+    if llm_config["type"] == "groq":
+        # Groq's SDK is OpenAI-compatible: chat.completions only
+        response = llm_config["client"].chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content.strip()
+    
+    return None
+
+
+def stream_complete(prompt: str, max_tokens: int, temperature: float = 0.2) -> Iterator[str]:
+    """
+    Streaming counterpart of complete(): yields text pieces as they arrive.
+    
+    Yields nothing if no LLM is configured. Both SDKs expose the same
+    OpenAI-style chunk format through chat.completions with stream=True.
+    """
+    llm_config = get_available_client()
+    
+    if llm_config["type"] == "openai":
+        model = "gpt-4o-mini"
+    elif llm_config["type"] == "groq":
+        model = "llama-3.3-70b-versatile"
+    else:
+        return
+    
+    stream = llm_config["client"].chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True
+    )
+    for event in stream:
+        if event.choices and event.choices[0].delta.content:
+            yield event.choices[0].delta.content
@@ -12,12 +12,28 @@ Cons: Slightly lower quality than GPT-4
 Setup: Install Ollama, run: ollama pull llama2
 """
 
+import json
 import requests
 import os
-from typing import Optional
-from app.llm_client import get_openai_client
+import time
+from typing import Iterator, Optional
+from requests.adapters import HTTPAdapter
+from app.llm_client import get_available_client
 
-openai_client = get_openai_client()
+# One keep-alive connection pool for all Ollama calls
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+# Ollama availability probes are reused for this many seconds
+AVAILABILITY_TTL = 30
+_availability = {}  # {base_url: (checked_at, is_available)}
+
+# How long Ollama keeps the model loaded after a request. While loaded, it
+# reuses the KV cache of the longest prompt prefix shared with the previous
+# request, so repeated context is not prefilled again.
+KEEP_ALIVE = os.getenv("LOCAL_LLM_KEEP_ALIVE", "30m")
 
 class LocalLLMClient:
     """
@@ -32,15 +48,29 @@ class LocalLLMClient:
         """
         self.model = model
         self.base_url = base_url
-        self.is_available = self._check_availability()
+        # Per-call fields are merged into these when building a request
+        self._generate_url = f"{base_url}/api/generate"
+        self._base_payload = {"model": model, "keep_alive": KEEP_ALIVE}
+    
+    @property
+    def is_available(self) -> bool:
+        """Whether Ollama is running (probed at most every AVAILABILITY_TTL seconds)."""
+        return self._check_availability()
     
     def _check_availability(self) -> bool:
         """Check if Ollama is running."""
+        now = time.monotonic()
+        cached = _availability.get(self.base_url)
+        if cached and now - cached[0] < AVAILABILITY_TTL:
+            return cached[1]
+        
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=2)
-            return response.status_code == 200
+            response = _SESSION.get(f"{self.base_url}/api/tags", timeout=2)
+            available = response.status_code == 200
         except:
-            return False
+            available = False
+        _availability[self.base_url] = (now, available)
+        return available
     
     def generate(self, prompt: str, temperature: float = 0.2, 
                 max_tokens: int = 500, stream: bool = False) -> str:
@@ -51,30 +81,29 @@ class LocalLLMClient:
             prompt: Input prompt
             temperature: Creativity level (0-1)
             max_tokens: Max response length
-            stream: Stream response or get all at once
+            stream: Receive the response incrementally (see generate_stream)
+                and join it, or get all at once
         
         Returns:
             Generated text
         """
         
-        if not self.is_available:
-            print(f"⚠ Warning: Ollama not running at {self.base_url}")
-            print("  Install: https://ollama.ai")
-            print("  Run: ollama pull llama2")
-            print("  Run: ollama serve")
-            raise ConnectionError("Local LLM not available. Falling back to OpenAI.")
+        if stream:
+            return "".join(self.generate_stream(prompt, temperature, max_tokens)).strip()
+        
+        self._ensure_available()
         
         payload = {
-            "model": self.model,
+            **self._base_payload,
             "prompt": prompt,
             "temperature": temperature,
             "num_predict": max_tokens,
-            "stream": stream
+            "stream": False
         }
         
         try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
+            response = _SESSION.post(
+                self._generate_url,
                 json=payload,
                 timeout=120  # Local LLMs can be slow
             )
@@ -89,6 +118,54 @@ class LocalLLMClient:
             print(f"Error calling local LLM: {e}")
             raise
     
+    def generate_stream(self, prompt: str, temperature: float = 0.2,
+                        max_tokens: int = 500) -> Iterator[str]:
+        """
+        Generate text using local LLM, yielding pieces as Ollama produces them.
+        """
+        self._ensure_available()
+        
+        payload = {
+            **self._base_payload,
+            "prompt": prompt,
+            "temperature": temperature,
+            "num_predict": max_tokens,
+            "stream": True
+        }
+        
+        try:
+            with _SESSION.post(
+                self._generate_url,
+                json=payload,
+                stream=True,
+                timeout=120  # Local LLMs can be slow
+            ) as response:
+                if response.status_code != 200:
+                    raise Exception(f"Error: {response.status_code}")
+                
+                # One JSON object per line until "done"
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+        
+        except Exception as e:
+            print(f"Error calling local LLM: {e}")
+            raise
+    
+    def _ensure_available(self):
+        """Raise ConnectionError (with setup hints) if Ollama isn't running."""
+        if not self.is_available:
+            print(f"⚠ Warning: Ollama not running at {self.base_url}")
+            print("  Install: https://ollama.ai")
+            print("  Run: ollama pull llama2")
+            print("  Run: ollama serve")
+            raise ConnectionError("Local LLM not available. Falling back to OpenAI.")
+    
     def generate_chat(self, messages: list, temperature: float = 0.2) -> str:
         """
         Chat-style interface.
@@ -101,21 +178,17 @@ class LocalLLMClient:
             Generated response
         """
         
-        # Convert messages to prompt format
-        prompt = ""
-        for msg in messages:
-            role = msg["role"].upper()
-            content = msg["content"]
-            prompt += f"{role}:\n{content}\n\n"
-        
-        prompt += "ASSISTANT:\n"
+        # Convert messages to prompt format (joined once, not grown with +=)
+        prompt = "".join(
+            f"{msg['role'].upper()}:\n{msg['content']}\n\n" for msg in messages
+        ) + "ASSISTANT:\n"
         
         return self.generate(prompt, temperature=temperature)
     
     def get_available_models(self) -> list:
         """Get list of available local models."""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = _SESSION.get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 return [model["name"] for model in data.get("models", [])]
@@ -134,6 +207,18 @@ class FallbackLLM:
         self.local_client = LocalLLMClient(model=local_model)
         self.use_openai_fallback = use_openai_fallback
         self.using_local = self.local_client.is_available
+        self._openai = None  # created on first fallback
+    
+    def _get_openai(self):
+        """
+        OpenAI client for the fallback path: the process-wide shared client,
+        so fallbacks reuse its keep-alive connection pool.
+        """
+        if self._openai is None:
+            llm_config = get_available_client()
+            if llm_config["type"] == "openai":
+                self._openai = llm_config["client"]
+        return self._openai
     
     def generate(self, prompt: str, temperature: float = 0.2, 
                 max_tokens: int = 500) -> dict:
@@ -165,7 +250,7 @@ class FallbackLLM:
                 self.using_local = False
         
         # Fallback to OpenAI
-        response = openai_client.chat.completions.create(
+        response = self._get_openai().chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=temperature,
@@ -195,7 +280,7 @@ class FallbackLLM:
                 self.using_local = False
         
         # Fallback to OpenAI
-        response = openai_client.chat.completions.create(
+        response = self._get_openai().chat.completions.create(
             model="gpt-4o-mini",
             messages=messages,
             temperature=temperature
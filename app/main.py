@@ -1,4 +1,11 @@
+import asyncio
+import json
+import shutil
+import threading
+import traceback
+
 from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
 from typing import Optional
@@ -6,54 +13,77 @@ from typing import Optional
 # Basic imports
 from app.ingestion import process_document
 from app.retrieval import retrieve_candidates
-from app.rerank import rerank
-from app.llm import generate_answer
+from app.rerank import rerank, rerank_many
+from app.llm import generate_answer, generate_answer_stream
+from app.embeddings import embed_texts
 
 # Advanced feature imports
-from app.hybrid_search import HybridSearcher
+from app.hybrid_search import HybridSearcher, reciprocal_rank_fusion
 from app.query_expansion import expand_query
-from app.context_compression import compress_context, estimate_token_savings
+from app.context_compression import compress_context, estimate_token_savings, should_compress
 from app.metadata_filter import MetadataFilter
 from app.multi_hop_retrieval import MultiHopRetriever
-from app.answer_verification import verify_and_fallback
+from app.answer_verification import verify_and_fallback_async
 from app.recursive_retrieval import RecursiveRetriever
 from app.adaptive_thresholds import AdaptiveThreshold
 from app.caching import SmartCache
 from app.local_llm import FallbackLLM
 from app.free_llm import get_free_llm
+from app.llm_client import close_available_client
+from app.pdf_extract import shutdown_executor as shutdown_pdf_executor
 
-app = FastAPI(title="Advanced RAG QA System")
-
-# Initialize advanced components with error handling
+# Try to import orjson (native JSON encoder for responses)
 try:
-    hybrid_searcher = HybridSearcher()
-except Exception as e:
-    print(f"Warning: HybridSearcher init failed: {e}")
-    hybrid_searcher = None
+    import orjson  # noqa: F401  (ORJSONResponse needs it at response time)
+    from fastapi.responses import ORJSONResponse
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
-try:
-    smart_cache = SmartCache()
-except Exception as e:
-    print(f"Warning: SmartCache init failed: {e}")
-    smart_cache = None
+app = FastAPI(
+    title="Advanced RAG QA System",
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
+)
 
-try:
-    multi_hop = MultiHopRetriever()
-except Exception as e:
-    print(f"Warning: MultiHopRetriever init failed: {e}")
-    multi_hop = None
+# Candidates kept after fusing query-expansion results, before reranking
+EXPANSION_CANDIDATES = 12
 
-try:
-    recursive_retriever = RecursiveRetriever()
-except Exception as e:
-    print(f"Warning: RecursiveRetriever init failed: {e}")
-    recursive_retriever = None
+def _lazy_component(name: str, factory):
+    """
+    Getter that builds a shared component on first use, exactly once even
+    under concurrent requests. Returns None (after a warning) if init fails.
+    getter.peek() returns the component only if it is already built.
+    """
+    lock = threading.Lock()
+    state = {}
+    
+    def getter():
+        if "instance" not in state:
+            with lock:
+                if "instance" not in state:
+                    try:
+                        state["instance"] = factory()
+                    except Exception as e:
+                        print(f"Warning: {name} init failed: {e}")
+                        state["instance"] = None
+        return state["instance"]
+    
+    getter.peek = lambda: state.get("instance")
+    return getter
 
-try:
-    local_llm = FallbackLLM(use_openai_fallback=True)
-except Exception as e:
-    print(f"Warning: FallbackLLM init failed: {e}")
-    local_llm = None
+# Advanced components are built by the first endpoint that needs them, so
+# startup and light endpoints don't pay for them
+get_hybrid_searcher = _lazy_component("HybridSearcher", HybridSearcher)
+get_smart_cache = _lazy_component("SmartCache", SmartCache)
+get_multi_hop = _lazy_component("MultiHopRetriever", MultiHopRetriever)
+get_recursive_retriever = _lazy_component("RecursiveRetriever", RecursiveRetriever)
+get_local_llm = _lazy_component("FallbackLLM", lambda: FallbackLLM(use_openai_fallback=True))
+
+@app.on_event("shutdown")
+def shutdown():
+    """Release shared clients and worker pools."""
+    close_available_client()
+    shutdown_pdf_executor()
 
 # Request/Response models
 class AdvancedAskRequest(BaseModel):
@@ -62,9 +92,11 @@ class AdvancedAskRequest(BaseModel):
     expand_queries: bool = True
     compress_context: bool = True
     verify_answer: bool = True
+    check_claims: bool = False  # Also check each claim (runs alongside verification)
     use_multi_hop: bool = False
     use_recursive: bool = False
     use_local_llm: bool = False
+    stream: bool = False  # Server-sent events: answer deltas, then a final event
 
 class FeedbackRequest(BaseModel):
     question: str
@@ -74,6 +106,12 @@ class FeedbackRequest(BaseModel):
 
 # ============= STANDARD ENDPOINTS =============
 
+def _save_upload(src, path: str, chunk_size: int = 1 << 20) -> int:
+    """Copy an upload to disk without holding it all in memory; returns its size."""
+    with open(path, "wb") as f:
+        shutil.copyfileobj(src, f, chunk_size)
+        return f.tell()
+
 @app.post("/upload")
 async def upload(file: UploadFile = File(...), bg: BackgroundTasks = None):
     """
@@ -88,11 +126,9 @@ async def upload(file: UploadFile = File(...), bg: BackgroundTasks = None):
         # Create directory if it doesn't exist
         Path("data/raw_docs").mkdir(parents=True, exist_ok=True)
         
-        # Save file
+        # Save file in 1 MiB pieces, off the event loop
         path = f"data/raw_docs/{file.filename}"
-        with open(path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        size = await asyncio.to_thread(_save_upload, file.file, path)
         
         # Process in background
         bg.add_task(process_document, path)
@@ -101,7 +137,7 @@ async def upload(file: UploadFile = File(...), bg: BackgroundTasks = None):
             "status": "success",
             "message": "File uploaded and processing started",
             "filename": file.filename,
-            "size": len(content)
+            "size": size
         }
     
     except Exception as e:
@@ -145,8 +181,85 @@ async def ask(question: str):
             "error": str(e)
         }
 
+@app.get("/ask/stream")
+async def ask_stream(question: str):
+    """Like /ask, but streams the answer text as the LLM produces it."""
+    try:
+        # Embedding, reranking and non-streaming LLM calls block, so they
+        # run in worker threads (StreamingResponse already iterates sync
+        # pieces in one)
+        candidates = await asyncio.to_thread(retrieve_candidates, question)
+        if not candidates:
+            return {
+                "answer": "No relevant documents found in database. Please upload documents first using /upload endpoint.",
+                "error": "No candidates retrieved"
+            }
+        ranked = await asyncio.to_thread(rerank, question, candidates) or candidates
+        context = "\n".join(ranked)
+        
+        # The first call probes Ollama over HTTP
+        free_llm, provider = await asyncio.to_thread(get_free_llm)
+        if free_llm and hasattr(free_llm, "answer_question_stream"):
+            pieces = free_llm.answer_question_stream(question, context)
+        elif free_llm:
+            result = await asyncio.to_thread(free_llm.answer_question, question, context)
+            pieces = iter([result.get("answer", "")])
+        else:
+            pieces = iter([await asyncio.to_thread(generate_answer, context, question)])
+    except Exception as e:
+        return {
+            "answer": f"Error processing question: {str(e)}",
+            "error": str(e)
+        }
+    
+    return StreamingResponse(pieces, media_type="text/plain; charset=utf-8")
+
 # ============= ADVANCED ENDPOINTS =============
 
+def _sse(payload: dict) -> str:
+    """Format one server-sent event."""
+    return f"data: {json.dumps(payload, default=str)}\n\n"
+
+async def _stream_advanced_answer(pieces, context: str, question: str,
+                                  question_embedding, metadata: dict, verify: bool,
+                                  check_claims: bool = False):
+    """
+    Forward answer pieces as SSE "delta" events, then verify and cache the
+    full answer and send it with the metadata in a final "done" event.
+    """
+    parts = []
+    completed = False
+    try:
+        while True:
+            # The LLM stream blocks on the network, so pull it off the event loop
+            piece = await asyncio.to_thread(next, pieces, None)
+            if piece is None:
+                break
+            parts.append(piece)
+            yield _sse({"delta": piece})
+        
+        answer = "".join(parts)
+        if verify:
+            final_answer, verification = await verify_and_fallback_async(
+                answer, context, question, threshold=0.6, check_claims=check_claims
+            )
+            metadata["answer_verified"] = verification["is_grounded"]
+            metadata["verification_confidence"] = verification["confidence"]
+            if "claims" in verification:
+                metadata["claim_verification"] = verification["claims"]
+        else:
+            final_answer = answer
+        
+        completed = True
+        yield _sse({"done": True, "answer": final_answer, "from_cache": False, "metadata": metadata})
+    except Exception as e:
+        yield _sse({"error": str(e)})
+    finally:
+        # Only cache answers that were generated in full
+        if completed:
+            smart_cache = get_smart_cache()
+            smart_cache.save_answer(question, final_answer, metadata, question_embedding)
+
 @app.post("/ask/advanced")
 async def ask_advanced(request: AdvancedAskRequest):
     """
@@ -160,11 +273,13 @@ async def ask_advanced(request: AdvancedAskRequest):
     - Multi-Hop Retrieval: Chain multiple retrievals
     - Recursive Retrieval: Iteratively improve results
     - Local LLM: Use offline models
+    - Stream: Send the answer as server-sent events while it is generated
+      (not combined with Local LLM or Recursive Retrieval)
     """
     
     try:
         # Check cache first
-        cached = smart_cache.get_answer_with_cache(request.question)
+        cached = get_smart_cache().get_answer_with_cache(request.question)
         if cached:
             return {
                 "answer": cached["answer"],
@@ -172,6 +287,16 @@ async def ask_advanced(request: AdvancedAskRequest):
                 "metadata": {"cache_hit": True}
             }
         
+        # Then look for an answered paraphrase of the question
+        question_embedding = (await asyncio.to_thread(embed_texts, [request.question]))[0]
+        cached = get_smart_cache().get_answer_semantic(question_embedding)
+        if cached:
+            return {
+                "answer": cached["answer"],
+                "from_cache": True,
+                "metadata": {"cache_hit": True, "cache_hit_semantic": True}
+            }
+        
         metadata = {}
         
         # ===== RETRIEVAL PHASE =====
@@ -183,41 +308,54 @@ async def ask_advanced(request: AdvancedAskRequest):
         # Retrieval strategy
         if request.use_multi_hop:
             # Multi-hop retrieval
-            multi_hop_result = multi_hop.multi_hop_retrieve(request.question, num_hops=2)
+            multi_hop_result = await asyncio.to_thread(
+                get_multi_hop().multi_hop_retrieve,
+                request.question, num_hops=2, query_embedding=question_embedding
+            )
             candidates = multi_hop_result["all_chunks"]
             metadata["retrieval_method"] = "multi-hop"
             metadata["hops"] = multi_hop_result["hops_performed"]
         
         elif request.expand_queries:
             # Query expansion + hybrid search
-            expanded_queries = expand_query(request.question, num_expansions=2)
-            all_candidates = set()
+            # LLM round-trip (or cache hit), kept off the event loop
+            expanded_queries = await asyncio.to_thread(expand_query, request.question, 2)
+            
+            # The first query is the question itself, already embedded; the
+            # expansions are embedded together in one batch
+            query_embeddings = [question_embedding]
+            if len(expanded_queries) > 1:
+                query_embeddings.extend(await asyncio.to_thread(embed_texts, expanded_queries[1:]))
             
-            for expanded_q in expanded_queries:
-                if request.use_hybrid_search:
-                    hybrid_results = hybrid_searcher.hybrid_search(
-                        expanded_q,
-                        semantic_weight=0.6,
-                        keyword_weight=0.4,
-                        top_k=5
-                    )
-                    all_candidates.update([chunk for chunk, _ in hybrid_results])
-                else:
-                    hybrid_results = retrieve_candidates(expanded_q)
-                    all_candidates.update(hybrid_results)
+            # Search all expanded queries concurrently in worker threads
+            if request.use_hybrid_search:
+                results = await asyncio.gather(*[
+                    asyncio.to_thread(get_hybrid_searcher().hybrid_search, expanded_q, 0.6, 0.4, 5, q_emb)
+                    for expanded_q, q_emb in zip(expanded_queries, query_embeddings)
+                ])
+                ranked_lists = [[chunk for chunk, _ in hybrid_results] for hybrid_results in results]
+            else:
+                ranked_lists = await asyncio.gather(*[
+                    asyncio.to_thread(retrieve_candidates, expanded_q, 0.5, q_emb)
+                    for expanded_q, q_emb in zip(expanded_queries, query_embeddings)
+                ])
             
-            candidates = list(all_candidates)
+            # Fuse the per-query rankings instead of a plain set union, so
+            # chunks found by several queries (or ranked high) come first
+            candidates = reciprocal_rank_fusion(ranked_lists, top_k=EXPANSION_CANDIDATES)
             metadata["retrieval_method"] = "query_expansion"
             metadata["queries_used"] = expanded_queries
         
         else:
             # Standard or hybrid search
             if request.use_hybrid_search:
-                hybrid_results = hybrid_searcher.hybrid_search(request.question, top_k=8)
+                hybrid_results = get_hybrid_searcher().hybrid_search(
+                    request.question, top_k=8, query_embedding=question_embedding
+                )
                 candidates = [chunk for chunk, _ in hybrid_results]
                 metadata["retrieval_method"] = "hybrid"
             else:
-                candidates = retrieve_candidates(request.question)
+                candidates = retrieve_candidates(request.question, query_embedding=question_embedding)
                 metadata["retrieval_method"] = "semantic"
         
         if not candidates:
@@ -235,24 +373,44 @@ async def ask_advanced(request: AdvancedAskRequest):
             ranked = candidates[:3]
         metadata["reranked_count"] = len(ranked)
         
-        # Compress context if requested
+        # Compress context if requested and not already small (judged by a
+        # rough chars/4 token estimate, which savings below also use)
+        joined = "\n".join(ranked)
         if request.compress_context:
+            metadata["token_estimate_method"] = "rough"
+        compressed = request.compress_context and should_compress(joined)
+        if compressed:
             compressed_ranked = compress_context(
-                "\n".join(ranked),
+                joined,
                 request.question,
                 strategy="extract"
             )
             context = compressed_ranked
-            savings = estimate_token_savings("\n".join(ranked), compressed_ranked)
+            savings = estimate_token_savings(joined, compressed_ranked)
             metadata["compression"] = savings
         else:
-            context = "\n".join(ranked)
+            context = joined
         
         # ===== GENERATION PHASE =====
         
+        if request.stream and not (request.use_local_llm or request.use_recursive):
+            # Verification and caching run once the stream has finished
+            metadata["llm_model"] = "gpt-4o-mini"
+            metadata["llm_local"] = False
+            return StreamingResponse(
+                _stream_advanced_answer(
+                    generate_answer_stream(context, request.question),
+                    context, request.question, question_embedding,
+                    metadata, request.verify_answer, request.check_claims
+                ),
+                media_type="text/event-stream"
+            )
+        
         if request.use_local_llm:
-            # Use local LLM
-            result = local_llm.generate(
+            # Use local LLM. Ollama reuses the KV cache for the prompt prefix it
+            # saw last, so the context goes before the question. It stays in
+            # rerank order: the most relevant chunk leads.
+            result = get_local_llm().generate(
                 prompt=f"Answer based on context:\n{context}\n\nQuestion: {request.question}",
                 temperature=0.2
             )
@@ -268,24 +426,28 @@ async def ask_advanced(request: AdvancedAskRequest):
         # ===== VERIFICATION PHASE =====
         
         if request.verify_answer:
-            final_answer, verification = verify_and_fallback(
-                answer, context, request.question, threshold=0.6
+            final_answer, verification = await verify_and_fallback_async(
+                answer, context, request.question, threshold=0.6,
+                check_claims=request.check_claims
             )
             metadata["answer_verified"] = verification["is_grounded"]
             metadata["verification_confidence"] = verification["confidence"]
+            if "claims" in verification:
+                metadata["claim_verification"] = verification["claims"]
         else:
             final_answer = answer
         
         # ===== RECURSIVE IMPROVEMENT =====
         
         if request.use_recursive:
-            recursive_result = recursive_retriever.recursive_retrieve(request.question)
+            recursive_result = get_recursive_retriever().recursive_retrieve(request.question)
             final_answer = recursive_result["final_answer"]
             metadata["recursive_iterations"] = recursive_result["iterations"]
             metadata["final_confidence"] = recursive_result["confidence"]
         
         # Cache the answer
-        smart_cache.cache.set(request.question, final_answer, metadata)
+        smart_cache = get_smart_cache()
+        smart_cache.save_answer(request.question, final_answer, metadata, question_embedding)
         
         return {
             "answer": final_answer,
@@ -293,13 +455,27 @@ async def ask_advanced(request: AdvancedAskRequest):
             "metadata": metadata
         }
     except Exception as e:
-        import traceback
         return {
             "answer": f"Error: {str(e)}",
             "error": str(e),
             "traceback": traceback.format_exc()
         }
 
+def _retrieve_semantic(question: str, query_embedding) -> tuple[list[str], dict]:
+    return retrieve_candidates(question, query_embedding=query_embedding), {}
+
+def _retrieve_hybrid(question: str, query_embedding) -> tuple[list[str], dict]:
+    hybrid_results = get_hybrid_searcher().hybrid_search(
+        question, top_k=8, query_embedding=query_embedding
+    )
+    return [chunk for chunk, _ in hybrid_results], {}
+
+def _retrieve_multi_hop(question: str, query_embedding) -> tuple[list[str], dict]:
+    multi_hop_result = get_multi_hop().multi_hop_retrieve(
+        question, num_hops=2, query_embedding=query_embedding
+    )
+    return multi_hop_result["all_chunks"][:8], {"hops": multi_hop_result["hops_performed"]}
+
 @app.get("/ask/compare")
 async def ask_compare(question: str):
     """
@@ -308,61 +484,60 @@ async def ask_compare(question: str):
     """
     
     try:
-        results = {}
+        # Embed the question once for all strategies
+        question_embedding = (await asyncio.to_thread(embed_texts, [question]))[0]
         
-        # Standard semantic
-        candidates = retrieve_candidates(question)
-        if not candidates:
+        # The strategies retrieve independently, so run them concurrently
+        # in worker threads
+        strategies = {
+            "semantic": _retrieve_semantic,
+            "hybrid": _retrieve_hybrid,
+            "multi_hop": _retrieve_multi_hop,
+        }
+        retrievals = await asyncio.gather(
+            *[asyncio.to_thread(run, question, question_embedding) for run in strategies.values()],
+            return_exceptions=True
+        )
+        
+        if not isinstance(retrievals[0], Exception) and not retrievals[0][0]:
             return {
                 "comparison": "No documents in database",
                 "error": "Please upload documents first"
             }
         
-        ranked = rerank(question, candidates, top_n=3)
-        if not ranked:
-            ranked = candidates[:3]
-        semantic_context = "\n".join(ranked)
-        semantic_answer = generate_answer(semantic_context, question)
-        results["semantic"] = {
-            "chunks_found": len(candidates),
-            "answer": semantic_answer[:200]
-        }
+        results = {}
+        found = {}
+        for name, retrieval in zip(strategies, retrievals):
+            if isinstance(retrieval, Exception):
+                results[name] = {"error": str(retrieval)}
+            elif retrieval[0]:
+                found[name] = retrieval
         
-        # Hybrid
-        hybrid_results = hybrid_searcher.hybrid_search(question, top_k=8)
-        hybrid_chunks = [chunk for chunk, _ in hybrid_results]
-        if hybrid_chunks:
-            hybrid_ranked = rerank(question, hybrid_chunks, top_n=3)
-            if not hybrid_ranked:
-                hybrid_ranked = hybrid_chunks[:3]
-            hybrid_context = "\n".join(hybrid_ranked)
-            hybrid_answer = generate_answer(hybrid_context, question)
-            results["hybrid"] = {
-                "chunks_found": len(hybrid_chunks),
-                "answer": hybrid_answer[:200]
-            }
+        # One cross-encoder pass over the union of all strategies' chunks
+        ranked_lists = await asyncio.to_thread(
+            rerank_many, question, [chunks for chunks, _ in found.values()], 3
+        )
         
-        # Multi-hop
-        multi_hop_result = multi_hop.multi_hop_retrieve(question, num_hops=2)
-        multi_hop_chunks = multi_hop_result["all_chunks"][:8]
-        if multi_hop_chunks:
-            multi_hop_ranked = rerank(question, multi_hop_chunks, top_n=3)
-            if not multi_hop_ranked:
-                multi_hop_ranked = multi_hop_chunks[:3]
-            multi_hop_context = "\n".join(multi_hop_ranked)
-            multi_hop_answer = generate_answer(multi_hop_context, question)
-            results["multi_hop"] = {
-                "chunks_found": len(multi_hop_chunks),
-                "hops": multi_hop_result["hops_performed"],
-                "answer": multi_hop_answer[:200]
-            }
+        # Answer each strategy's top chunks concurrently
+        answers = await asyncio.gather(
+            *[
+                asyncio.to_thread(generate_answer, "\n".join(ranked or chunks[:3]), question)
+                for (chunks, _), ranked in zip(found.values(), ranked_lists)
+            ],
+            return_exceptions=True
+        )
+        
+        for (name, (chunks, extra)), answer in zip(found.items(), answers):
+            if isinstance(answer, Exception):
+                results[name] = {"error": str(answer)}
+            else:
+                results[name] = {"chunks_found": len(chunks), **extra, "answer": answer[:200]}
         
         return {
             "question": question,
-            "comparison": results
+            "comparison": {name: results[name] for name in strategies if name in results}
         }
     except Exception as e:
-        import traceback
         return {
             "question": question,
             "error": str(e),
@@ -375,7 +550,7 @@ async def ask_compare(question: str):
 @app.post("/feedback")
 async def add_feedback(feedback: FeedbackRequest):
     """Submit feedback on answer quality."""
-    smart_cache.feedback.add_feedback(
+    get_smart_cache().feedback.add_feedback(
         feedback.question,
         feedback.answer,
         feedback.rating,
@@ -389,6 +564,7 @@ async def add_feedback(feedback: FeedbackRequest):
 @app.get("/stats")
 async def get_stats():
     """Get system statistics."""
+    smart_cache = get_smart_cache()
     cache_stats = smart_cache.cache.get_cache_stats()
     feedback_summary = smart_cache.feedback.get_feedback_summary()
     
@@ -400,6 +576,8 @@ async def get_stats():
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
+    # Never build the local LLM (Ollama probe) just to report on it
+    local_llm = get_local_llm.peek()
     return {
         "status": "healthy",
         "features": {
@@ -410,6 +588,6 @@ async def health_check():
             "multi_hop": True,
             "recursive": True,
             "caching": True,
-            "local_llm": local_llm.using_local
+            "local_llm": bool(local_llm and local_llm.using_local)
         }
     }
@@ -70,10 +70,13 @@ class MetadataFilter:
             return {"author": {"$in": allowed_authors}}
     
     @staticmethod
-    def combine_filters(*filters) -> dict:
+    def combine_filters(*filters) -> Optional[dict]:
         """
         Combine multiple filters with AND logic.
         
+        Returns None when every filter is empty (ChromaDB treats no
+        filter as no constraint), and a single filter as-is.
+        
         Usage:
             combined = combine_filters(
                 date_range_filter("2024-01-01", "2026-12-31"),
@@ -81,10 +84,15 @@ class MetadataFilter:
                 author_filter(["Expert"])
             )
         """
+        nonempty = [filter_dict for filter_dict in filters if filter_dict]
+        if not nonempty:
+            return None
+        if len(nonempty) == 1:
+            return nonempty[0]
+        
         combined = {}
-        for filter_dict in filters:
-            if filter_dict:
-                combined.update(filter_dict)
+        for filter_dict in nonempty:
+            combined.update(filter_dict)
         return combined
     
     @staticmethod
@@ -11,14 +11,26 @@ Result: Combine both to answer the full question!
 Why? Some questions need multiple lookups to answer fully.
 """
 
+import re
+
 from app.embeddings import embed_texts
-from app.vectordb import query_chunks
+from app.vectordb import query_chunks, query_chunks_batch
 from app.hybrid_search import HybridSearcher
 
+# Capitalized phrases, e.g. "Isaac Newton"
+_ENTITY_RE = re.compile(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b')
+
+# Capitalized only because they start a sentence; not entities
+_ENTITY_STOPWORDS = frozenset({
+    "The", "This", "That", "These", "Those", "A", "An", "It", "Its",
+    "He", "She", "They", "We", "I", "You", "His", "Her", "Their", "Our",
+    "In", "On", "At", "For", "With", "By", "From", "As", "Of", "To",
+    "And", "But", "Or", "If", "When", "While", "However", "Also", "There",
+})
+
 class MultiHopRetriever:
     def __init__(self, max_hops: int = 3):
         self.max_hops = max_hops
-        self.retrieval_chain = []
     
     def extract_entities(self, text: str) -> list[str]:
         """
@@ -29,20 +41,21 @@ class MultiHopRetriever:
             "Isaac Newton invented calculus"
             -> ["Isaac Newton", "calculus"]
         """
-        import re
-        
-        # Find capitalized phrases
-        entities = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', text)
-        return list(set(entities))  # Remove duplicates
+        # Find capitalized phrases, dropping duplicates and sentence starters
+        return list(set(_ENTITY_RE.findall(text)) - _ENTITY_STOPWORDS)
     
-    def first_hop_retrieval(self, question: str, top_k: int = 5) -> tuple[list[str], list[str]]:
+    def first_hop_retrieval(self, question: str, top_k: int = 5,
+                            query_embedding=None, chain: list = None) -> tuple[list[str], list[str]]:
         """
         First retrieval based on original question.
+        Pass query_embedding if the question is already embedded, and chain
+        to have the hop's details appended to it.
         
         Returns:
             (retrieved_chunks, extracted_entities)
         """
-        query_embedding = embed_texts([question])[0]
+        if query_embedding is None:
+            query_embedding = embed_texts([question])[0]
         results = query_chunks(query_embedding, top_k=top_k)
         
         chunks = results["documents"][0] if results["documents"] else []
@@ -53,31 +66,50 @@ class MultiHopRetriever:
             entities = self.extract_entities(chunk)
             all_entities.extend(entities)
         
-        self.retrieval_chain.append({
-            "hop": 1,
-            "query": question,
-            "chunks": chunks,
-            "entities": list(set(all_entities))
-        })
+        if chain is not None:
+            chain.append({
+                "hop": 1,
+                "query": question,
+                "chunks": chunks,
+                "entities": list(set(all_entities))
+            })
         
         return chunks, all_entities
     
-    def subsequent_hop_retrieval(self, entities: list[str], hop_num: int, top_k: int = 3) -> list[str]:
+    def subsequent_hop_retrieval(self, entities: list[str], hop_num: int, top_k: int = 3,
+                                 chain: list = None) -> tuple[list[str], list[str]]:
         """
         Retrieve using entities from previous hop.
         
         This searches for documents related to the entities found earlier.
+        The hop's details are appended to chain, if given.
+        
+        Returns:
+            (retrieved_chunks, extracted_entities)
         """
         if not entities:
-            return []
+            return [], []
         
         # Create query from entities
-        entity_query = " ".join(entities[:3])  # Use top 3 entities
-        
-        query_embedding = embed_texts([entity_query])[0]
-        results = query_chunks(query_embedding, top_k=top_k)
-        
-        chunks = results["documents"][0] if results["documents"] else []
+        top_entities = list(dict.fromkeys(entities))[:3]  # Use top 3 entities
+        entity_query = " ".join(top_entities)
+        
+        # Combined query plus one sub-query per entity, embedded in a single
+        # batch and searched in a single collection query
+        queries = [entity_query] + (top_entities if len(top_entities) > 1 else [])
+        query_embeddings = embed_texts(queries)
+        results = query_chunks_batch(query_embeddings, top_k=top_k)
+        
+        # Interleave results rank by rank so the combined query leads,
+        # dropping duplicates, and keep top_k overall
+        chunks = []
+        seen = set()
+        for ranked in zip(*(results["documents"] or [])):
+            for chunk in ranked:
+                if chunk not in seen:
+                    seen.add(chunk)
+                    chunks.append(chunk)
+        chunks = chunks[:top_k]
         
         # Extract new entities for next hop
         new_entities = []
@@ -85,16 +117,18 @@ class MultiHopRetriever:
             entities = self.extract_entities(chunk)
             new_entities.extend(entities)
         
-        self.retrieval_chain.append({
-            "hop": hop_num,
-            "query": entity_query,
-            "chunks": chunks,
-            "entities": list(set(new_entities))
-        })
+        if chain is not None:
+            chain.append({
+                "hop": hop_num,
+                "query": entity_query,
+                "chunks": chunks,
+                "entities": list(set(new_entities))
+            })
         
         return chunks, new_entities
     
-    def multi_hop_retrieve(self, question: str, num_hops: int = 2, top_k_per_hop: int = 5) -> dict:
+    def multi_hop_retrieve(self, question: str, num_hops: int = 2, top_k_per_hop: int = 5,
+                           query_embedding=None) -> dict:
         """
         Perform multi-hop retrieval.
         
@@ -102,6 +136,7 @@ class MultiHopRetriever:
             question: Original user question
             num_hops: How many hops to perform (2-3 recommended)
             top_k_per_hop: Results per hop
+            query_embedding: Embedding of question, if already computed
         
         Returns:
             {
@@ -110,48 +145,58 @@ class MultiHopRetriever:
                 "summary": "Hop 1 found X, Hop 2 found Y, ..."
             }
         """
-        self.retrieval_chain = []
-        all_chunks = set()
+        # Built per call rather than kept on self, since one retriever is
+        # shared by concurrent requests
+        chain = []
+        # Chunks in retrieval order (first hop first), without duplicates
+        all_chunks = []
+        seen = set()
+        
+        def collect(chunks):
+            for chunk in chunks:
+                if chunk not in seen:
+                    seen.add(chunk)
+                    all_chunks.append(chunk)
         
         # First hop
-        chunks, entities = self.first_hop_retrieval(question, top_k_per_hop)
-        all_chunks.update(chunks)
+        chunks, entities = self.first_hop_retrieval(question, top_k_per_hop, query_embedding, chain)
+        collect(chunks)
         
         # Subsequent hops
         current_entities = entities
         for hop in range(2, min(num_hops + 1, self.max_hops + 1)):
             chunks, current_entities = self.subsequent_hop_retrieval(
-                current_entities, hop, top_k_per_hop
+                current_entities, hop, top_k_per_hop, chain
             )
-            all_chunks.update(chunks)
+            collect(chunks)
             
             if not current_entities:  # No new entities found
                 break
         
         # Build summary
         summary_parts = []
-        for hop_info in self.retrieval_chain:
+        for hop_info in chain:
             summary_parts.append(
                 f"Hop {hop_info['hop']}: Found {len(hop_info['chunks'])} chunks, "
                 f"extracted {len(hop_info['entities'])} entities"
             )
         
         return {
-            "all_chunks": list(all_chunks),
+            "all_chunks": all_chunks,
             "total_chunks": len(all_chunks),
-            "hops_performed": len(self.retrieval_chain),
-            "chain": self.retrieval_chain,
+            "hops_performed": len(chain),
+            "chain": chain,
             "summary": " | ".join(summary_parts)
         }
     
-    def get_chain_visualization(self) -> str:
+    def get_chain_visualization(self, chain: list[dict]) -> str:
         """
-        Pretty print the retrieval chain.
+        Pretty print a retrieval chain returned by multi_hop_retrieve.
         """
         output = "Multi-Hop Retrieval Chain:\n"
         output += "=" * 50 + "\n"
         
-        for hop_info in self.retrieval_chain:
+        for hop_info in chain:
             output += f"\n🔍 Hop {hop_info['hop']}:\n"
             output += f"   Query: {hop_info['query']}\n"
             output += f"   Chunks found: {len(hop_info['chunks'])}\n"
@@ -0,0 +1,78 @@
+"""
+PDF page text extraction, in parallel processes for large files.
+
+Kept separate from ingestion.py so worker processes only import PyPDF2,
+not the embedding model.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from PyPDF2 import PdfReader
+
+# PDFs with at least this many pages are extracted in parallel processes
+PARALLEL_PDF_MIN_PAGES = 32
+
+_executor = None  # Shared worker pool, started on first large PDF
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    The shared worker pool, started once so each large PDF doesn't pay for
+    process startup. Workers are spawned rather than forked: a fork of the
+    server would copy the loaded models and any threads' held locks.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def shutdown_executor():
+    """Stop the shared worker pool (call on shutdown)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def extract_pages(file_path: str, start: int, stop: int):
+    """Text of pages [start, stop), from a reader owned by this process."""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_page_texts(file_path: str):
+    """
+    Page texts in order.
+    
+    Large PDFs are split into page ranges extracted by worker processes:
+    extract_text is pure Python (GIL-bound) and a PdfReader isn't safe to
+    share between threads, so threads wouldn't help.
+    """
+    num_pages = len(PdfReader(file_path).pages)
+    workers = min(8, os.cpu_count() or 1)
+    
+    if num_pages < PARALLEL_PDF_MIN_PAGES or workers < 2:
+        yield from extract_pages(file_path, 0, num_pages)
+        return
+    
+    step = -(-num_pages // (workers * 4))  # a few ranges per worker for balance
+    starts = range(0, num_pages, step)
+    ranges = _get_executor(workers).map(
+        extract_pages,
+        repeat(file_path),
+        starts,
+        [min(start + step, num_pages) for start in starts]
+    )
+    for page_texts in ranges:
+        yield from page_texts
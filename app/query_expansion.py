@@ -12,16 +12,29 @@ Expanded to:
 Why? Multiple searches catch more relevant docs!
 """
 
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
 from app.rate_limit import rate_limit
-from app.llm_client import get_available_client
+from app.llm_client import complete
+
+# Expansions are reused for an hour, for the most recent questions
+EXPANSION_CACHE_SIZE = 1024
+EXPANSION_CACHE_TTL = 3600
+_expansion_cache = OrderedDict()  # {(question, num_expansions): (stored_at, queries)}
+_inflight = {}  # {(question, num_expansions): Future} for LLM calls in progress
+_expansion_lock = threading.Lock()
 
-llm_config = get_available_client()
 
-@rate_limit(max_calls=10, time_window=60)
 def expand_query(question: str, num_expansions: int = 3) -> list[str]:
     """
     Use LLM to expand a simple question into multiple search queries.
     
+    Results are cached, and concurrent calls for the same question wait
+    for one shared LLM call instead of each making their own.
+    
     Args:
         question: Original user question
         num_expansions: How many variations to generate
@@ -29,11 +42,46 @@ def expand_query(question: str, num_expansions: int = 3) -> list[str]:
     Returns:
         List of expanded queries
     """
+    key = (question, num_expansions)
     
-    if not llm_config["client"]:
-        # No LLM available, return original question only
-        return [question]
+    with _expansion_lock:
+        cached = _expansion_cache.get(key)
+        if cached and time.monotonic() - cached[0] < EXPANSION_CACHE_TTL:
+            _expansion_cache.move_to_end(key)
+            return list(cached[1])
+        
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = _inflight[key] = Future()
+    
+    if not is_owner:
+        return list(future.result())
     
+    try:
+        queries = _expand_query_llm(question, num_expansions)
+    except BaseException as e:
+        with _expansion_lock:
+            del _inflight[key]
+        future.set_exception(e)
+        raise
+    
+    with _expansion_lock:
+        # Only real expansions are cached, not the fallback to the question alone
+        if len(queries) > 1:
+            _expansion_cache[key] = (time.monotonic(), queries)
+            _expansion_cache.move_to_end(key)
+            if len(_expansion_cache) > EXPANSION_CACHE_SIZE:
+                _expansion_cache.popitem(last=False)
+        del _inflight[key]
+    future.set_result(queries)
+    
+    return list(queries)
+
+
+@rate_limit(max_calls=10, time_window=60)
+def _expand_query_llm(question: str, num_expansions: int) -> list[str]:
+    """Ask the LLM for expansions (uncached)."""
     prompt = f"""
 You are a search query expert. Given a user question, generate {num_expansions} alternative search queries that would find relevant documents.
 
@@ -45,22 +93,9 @@ Return ONLY the queries, one per line, without numbering or bullets.
 """
     
     try:
-        if llm_config["type"] == "openai":
-            response = llm_config["client"].chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=200
-            )
-            expansions_text = response.choices[0].message.content.strip()
-        elif llm_config["type"] == "groq":
-            response = llm_config["client"].messages.create(
-                model="llama-3.3-70b-versatile",
-                max_tokens=200,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            expansions_text = response.content[0].text.strip()
-        else:
+        expansions_text = complete(prompt, max_tokens=200, temperature=0.7)
+        if expansions_text is None:
+            # No LLM available, return original question only
             return [question]
         
         expanded_queries = [q.strip() for q in expansions_text.split('\n') if q.strip()]
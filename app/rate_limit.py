@@ -1,47 +1,72 @@
+import inspect
+import threading
 import time
+from collections import defaultdict, deque
 from functools import wraps
 
-REQUESTS = {}
+# Per-IP request timestamps, oldest first
+REQUESTS = defaultdict(deque)
 LIMIT = 10
 WINDOW = 60
+_requests_lock = threading.Lock()  # Handlers run on a threadpool
 
 def allow(ip):
     now = time.time()
-    REQUESTS.setdefault(ip, [])
-    REQUESTS[ip] = [t for t in REQUESTS[ip] if now - t < WINDOW]
+    with _requests_lock:
+        times = REQUESTS[ip]
+        # Drop timestamps that fell out of the window
+        while times and now - times[0] >= WINDOW:
+            times.popleft()
 
-    if len(REQUESTS[ip]) >= LIMIT:
-        return False
+        if len(times) >= LIMIT:
+            return False
 
-    REQUESTS[ip].append(now)
-    return True
+        times.append(now)
+        return True
 
 
 def rate_limit(max_calls=10, time_window=60):
     """
     Decorator for rate limiting function calls.
     
+    Generator functions are charged when iteration starts (and raise
+    there), not when the generator object is created.
+    
     Args:
         max_calls: Maximum number of calls allowed
         time_window: Time window in seconds
     """
     def decorator(func):
-        call_times = []
+        # Shared by every caller: these limits protect the upstream LLM quota
+        call_times = deque()
+        lock = threading.Lock()
         
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            nonlocal call_times
+        def acquire():
             now = time.time()
             
-            # Remove calls outside the time window
-            call_times = [t for t in call_times if now - t < time_window]
-            
-            # Check if rate limit exceeded
-            if len(call_times) >= max_calls:
-                raise RuntimeError(f"Rate limit exceeded: {max_calls} calls per {time_window}s")
+            with lock:
+                # Remove calls outside the time window
+                while call_times and now - call_times[0] >= time_window:
+                    call_times.popleft()
+                
+                # Check if rate limit exceeded
+                if len(call_times) >= max_calls:
+                    raise RuntimeError(f"Rate limit exceeded: {max_calls} calls per {time_window}s")
+                
+                # Record this call
+                call_times.append(now)
+        
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                acquire()
+                yield from func(*args, **kwargs)
             
-            # Record this call
-            call_times.append(now)
+            return gen_wrapper
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            acquire()
             
             # Execute function
             return func(*args, **kwargs)
@@ -12,17 +12,84 @@ New retrieval: Gets better results
 This iterates until confident or max tries reached.
 """
 
+import math
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 from app.embeddings import embed_texts
 from app.vectordb import query_chunks
 from app.llm import generate_answer
 from app.answer_verification import verify_answer
-from app.llm_client import get_available_client
+from app.llm_client import complete
+
+# Provider errors worth retrying in refine_question (both SDKs share names)
+_RATE_LIMIT_ERRORS = ()
+_TRANSIENT_ERRORS = ()
+for _sdk in ("openai", "groq"):
+    try:
+        _module = __import__(_sdk)
+    except ImportError:
+        continue
+    _RATE_LIMIT_ERRORS += (_module.RateLimitError,)
+    _TRANSIENT_ERRORS += (_module.APITimeoutError, _module.APIConnectionError)
+
+REFINE_MAX_RETRIES = 2
+
+# Static instructions go in the system message, ahead of the per-call
+# question/answer, so repeated refinements share the same prompt prefix
+REFINE_SYSTEM_PROMPT = """You refine search queries for a document retrieval system.
+A user's question was answered from retrieved documents, but the answer was not satisfactory.
+Generate a refined, more specific search query to find better information.
+The query should be:
+1. More specific than the original
+2. Use different keywords
+3. Target missing information
+
+Return ONLY the refined query, nothing else."""
+
+# Pseudo-relevance feedback: terms taken from retrieved chunks
+_TERM_RE = re.compile(r"[a-z][a-z0-9-]{2,}")
+_STOPWORDS = frozenset("""
+a about above after again all also an and any are as at be because been before
+being between both but by can could did does doing during each few for from had
+has have having her here hers him his how however into its itself just more most
+not now off once only other our ours out over own same she should some such than
+that the their theirs them then there these they this those through too under
+until very was were what when where which while who whom why will with would you
+your yours may might must shall upon within without
+""".split())
+
+# "Context: B" citation line closing a multi-window answer, tolerating
+# markdown emphasis, brackets and a trailing period ("**Context:** [B].").
+# A closing "Context:" line without a readable letter still matches (with no
+# group) so it is stripped from the answer too
+_CONTEXT_TAG_RE = re.compile(
+    r"(?:^|\n)[ \t*_]*Context[ \t*_]*:[ \t*_]*"
+    r"(?:[\[<(]?([A-Za-z])[\]>)]?[\s.*_]*|[^\n]*\s*)$",
+    re.IGNORECASE
+)
 
 class RecursiveRetriever:
-    def __init__(self, max_iterations: int = 3, threshold: float = 0.6):
+    def __init__(self, max_iterations: int = 3, threshold: float = 0.6,
+                 window_size: int = 4, window_stride: int = 2, num_windows: int = 3):
         self.max_iterations = max_iterations
         self.threshold = threshold
+        # Each iteration offers the LLM up to num_windows (at most 4)
+        # overlapping windows of the retrieved chunks in one prompt
+        self.window_size = window_size
+        self.window_stride = window_stride
+        self.num_windows = min(num_windows, 4)
         self.iteration_history = []
+        # Per-instance memo of question embeddings (refinements often repeat,
+        # e.g. when refining fails and falls back to the original question)
+        self._embed_question = lru_cache(maxsize=256)(self._embed_question)
+    
+    def _embed_question(self, normalized_question: str):
+        """Embedding of an already normalized question."""
+        return embed_texts([normalized_question])[0]
     
     def refine_question(self, original_question: str, last_answer: str, 
                        iteration: int) -> str:
@@ -40,33 +107,34 @@ class RecursiveRetriever:
         if iteration == 1:
             return original_question
         
-        prompt = f"""
-The user originally asked: "{original_question}"
+        prompt = f"""The user originally asked: "{original_question}"
 
 Our first attempt retrieved answer: "{last_answer[:300]}..."
-
-This answer was not satisfactory. Generate a refined, more specific search query to find better information.
-The query should be:
-1. More specific than the original
-2. Use different keywords
-3. Target missing information
-
-Return ONLY the refined query, nothing else.
 """
         
-        try:
-            client = get_available_client()
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=100
-            )
-            
-            refined = response.choices[0].message.content.strip()
-            return refined
-        except:
-            return original_question
+        for attempt in range(REFINE_MAX_RETRIES + 1):
+            try:
+                refined = complete(prompt, max_tokens=100, temperature=0.3, system=REFINE_SYSTEM_PROMPT)
+                return refined.strip() if refined else original_question
+            except _RATE_LIMIT_ERRORS as e:
+                if attempt == REFINE_MAX_RETRIES:
+                    break
+                # Wait as long as the provider asks, else back off exponentially
+                retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = 2 ** attempt
+                time.sleep(delay)
+            except _TRANSIENT_ERRORS:
+                if attempt == REFINE_MAX_RETRIES:
+                    break
+                time.sleep(2 ** attempt)
+            except Exception as e:
+                print(f"Error refining question: {e}")
+                break
+        
+        return original_question
     
     def retrieve_with_refined_query(self, question: str, top_k: int = 8) -> list[str]:
         """
@@ -75,12 +143,116 @@ Return ONLY the refined query, nothing else.
         Returns:
             List of relevant chunks
         """
-        query_embedding = embed_texts([question])[0]
+        # MiniLM is uncased and ignores surrounding whitespace, so normalizing
+        # only widens cache hits without changing the embedding
+        query_embedding = self._embed_question(question.strip().lower())
         results = query_chunks(query_embedding, top_k=top_k)
         
         chunks = results["documents"][0] if results["documents"] else []
         return chunks
     
+    def expand_with_feedback(self, original_question: str, chunks: list[str],
+                             num_terms: int = 5) -> str:
+        """
+        Refine a question without an LLM (pseudo-relevance feedback): append
+        the terms most characteristic of the retrieved chunks.
+        
+        Terms are scored by total frequency, boosted by how many chunks
+        contain them; stopwords and words already in the question are skipped.
+        """
+        question_terms = set(_TERM_RE.findall(original_question.lower()))
+        tf = Counter()
+        df = Counter()
+        for chunk in chunks:
+            terms = [t for t in _TERM_RE.findall(chunk.lower())
+                     if t not in _STOPWORDS and t not in question_terms]
+            tf.update(terms)
+            df.update(set(terms))
+        
+        top_terms = sorted(tf, key=lambda t: tf[t] * math.log1p(df[t]), reverse=True)[:num_terms]
+        if not top_terms:
+            return original_question
+        return f"{original_question} {' '.join(top_terms)}"
+    
+    def _refine_and_retrieve(self, original_question: str, last_answer: str,
+                             chunks: list[str], iteration: int) -> tuple[str, list[str]]:
+        """
+        Refine the question and retrieve with it (the next iteration's inputs).
+        
+        The first refinement uses pseudo-relevance feedback from the chunks
+        (no LLM call); if that iteration doesn't converge either, later ones
+        ask the LLM.
+        """
+        if iteration == 2:
+            question = self.expand_with_feedback(original_question, chunks)
+        else:
+            question = self.refine_question(original_question, last_answer, iteration)
+        
+        # Refinement failed (fell back to the original question): retrieving
+        # again would only return the first iteration's chunks, so stop here
+        if question.strip().lower() == original_question.strip().lower():
+            return question, []
+        return question, self.retrieve_with_refined_query(question)
+    
+    def _chunk_windows(self, chunks: list[str]) -> list[list[str]]:
+        """
+        Overlapping windows of chunks, e.g. [:4], [2:6], [4:8] for 8 chunks.
+        A single window if the chunks fit in one.
+        """
+        if len(chunks) <= self.window_size:
+            return [chunks]
+        
+        windows = []
+        for start in range(0, len(chunks), self.window_stride):
+            windows.append(chunks[start:start + self.window_size])
+            if start + self.window_size >= len(chunks) or len(windows) == self.num_windows:
+                break
+        return windows
+    
+    def _answer_from_windows(self, windows: list[list[str]], question: str) -> tuple[str, int]:
+        """
+        Answer from several chunk windows in ONE LLM call: the windows are
+        tagged [A], [B], ... and the model answers from the best-grounded one
+        and names it.
+        
+        Returns:
+            (answer, index of the window it used)
+        """
+        if len(windows) == 1:
+            return generate_answer("\n".join(windows[0]), question), 0
+        
+        tagged = "\n\n".join(
+            f"[{chr(ord('A') + i)}]\n" + "\n".join(window) for i, window in enumerate(windows)
+        )
+        prompt = f"""
+Below are {len(windows)} alternative contexts, each tagged with a letter.
+Pick the ONE context that best answers the question and answer using ONLY that context.
+If the answer is not present in any of them, say you do not know.
+
+On the last line write "Context: <letter>" with the letter of the context you used.
+
+{tagged}
+
+Question: {question}
+"""
+        try:
+            response = complete(prompt, max_tokens=1024)
+        except Exception as e:
+            print(f"Error answering from windows: {e}")
+            response = None
+        
+        if not response:
+            # No LLM (demo mode) or error: answer from the top window
+            return generate_answer("\n".join(windows[0]), question), 0
+        
+        match = _CONTEXT_TAG_RE.search(response)
+        if not match:
+            return response, 0
+        best = ord(match.group(1).upper()) - ord("A") if match.group(1) else 0
+        if not 0 <= best < len(windows):
+            best = 0
+        return response[:match.start()].rstrip(), best
+    
     def recursive_retrieve(self, original_question: str, context_processor=None) -> dict:
         """
         Recursively refine retrieval until confident answer found or max iterations reached.
@@ -100,51 +272,69 @@ Return ONLY the refined query, nothing else.
         """
         self.iteration_history = []
         current_question = original_question
+        chunks = self.retrieve_with_refined_query(current_question)
         best_chunks = []
         best_answer = ""
         best_confidence = 0
+        seen_chunk_sets = set()
         
-        for iteration in range(1, self.max_iterations + 1):
-            # Retrieve with current question
-            chunks = self.retrieve_with_refined_query(current_question)
-            
-            if not chunks:
-                break
-            
-            # Generate answer from chunks
-            context = "\n".join(chunks)
-            answer = generate_answer(context, original_question)
-            
-            # Verify answer
-            verification = verify_answer(answer, context, original_question)
-            confidence = verification["confidence"]
-            
-            # Store iteration details
-            iteration_info = {
-                "iteration": iteration,
-                "question_used": current_question,
-                "chunks_found": len(chunks),
-                "answer": answer[:200],
-                "confidence": confidence,
-                "is_grounded": verification["is_grounded"]
-            }
-            self.iteration_history.append(iteration_info)
-            
-            # Update best if this is better
-            if confidence > best_confidence:
-                best_confidence = confidence
-                best_answer = answer
-                best_chunks = chunks
-            
-            # Check if satisfied
-            if verification["is_grounded"] and confidence >= self.threshold:
-                break
-            
-            # Refine question for next iteration
-            if iteration < self.max_iterations:
-                current_question = self.refine_question(
-                    original_question, answer, iteration + 1
-                )
+        # Runs the next iteration's refine + retrieval speculatively while the
+        # current answer is verified; its result is dropped if verification passes
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            for iteration in range(1, self.max_iterations + 1):
+                if not chunks:
+                    break
+                
+                # A refinement that found the same chunks (in any order) would
+                # only produce the same answer again
+                chunk_set = frozenset(chunks)
+                if chunk_set in seen_chunk_sets:
+                    break
+                seen_chunk_sets.add(chunk_set)
+                
+                # One LLM call answers from the best of the chunk windows
+                windows = self._chunk_windows(chunks)
+                answer, best = self._answer_from_windows(windows, original_question)
+                context = "\n".join(windows[best])
+                
+                next_step = None
+                if iteration < self.max_iterations:
+                    next_step = executor.submit(
+                        self._refine_and_retrieve, original_question, answer, chunks, iteration + 1
+                    )
+                
+                # Verify answer (overlaps with the speculative refinement)
+                verification = verify_answer(answer, context, original_question)
+                confidence = verification["confidence"]
+                
+                # Store iteration details
+                iteration_info = {
+                    "iteration": iteration,
+                    "question_used": current_question,
+                    "chunks_found": len(chunks),
+                    "answer": answer[:200],
+                    "confidence": confidence,
+                    "is_grounded": verification["is_grounded"]
+                }
+                self.iteration_history.append(iteration_info)
+                
+                # Update best if this is better
+                if confidence > best_confidence:
+                    best_confidence = confidence
+                    best_answer = answer
+                    best_chunks = windows[best]
+                
+                # Check if satisfied
+                if verification["is_grounded"] and confidence >= self.threshold:
+                    break
+                
+                # Refined question and its chunks for next iteration
+                if next_step is not None:
+                    current_question, chunks = next_step.result()
+        finally:
+            # Don't wait for a speculative refinement nobody needs
+            executor.shutdown(wait=False)
         
         return {
             "final_answer": best_answer,
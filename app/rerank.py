@@ -1,18 +1,53 @@
+import numpy as np
 from sentence_transformers import CrossEncoder
 
-reranker = CrossEncoder(
-    "cross-encoder/ms-marco-MiniLM-L-6-v2",
-    device="cuda"
-)
+MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+BATCH_SIZE = 64
 
-def rerank(question, chunks, top_n=3):
-    pairs = [[question, chunk] for chunk in chunks]
-    scores = reranker.predict(pairs)
+# Try CUDA (fp16 matmuls on tensor cores), fallback to CPU
+try:
+    reranker = CrossEncoder(MODEL_NAME, device="cuda")
+    reranker.model.half()
+except Exception:
+    reranker = CrossEncoder(MODEL_NAME, device="cpu")
 
-    ranked = sorted(
-        zip(chunks, scores),
-        key=lambda x: x[1],
-        reverse=True
+def _predict(question, chunks):
+    """Cross-encoder relevance scores of chunks for question, as a float array."""
+    scores = reranker.predict(
+        [[question, chunk] for chunk in chunks],
+        batch_size=BATCH_SIZE,
+        convert_to_numpy=True,
+        show_progress_bar=False
     )
+    return np.asarray(scores, dtype=np.float32)
+
+def _top_n(chunks, scores, top_n):
+    """Best top_n chunks by score: O(n) partition, then sort only those."""
+    if top_n < len(scores):
+        top = np.argpartition(scores, -top_n)[-top_n:]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [chunks[i] for i in top]
+
+def rerank(question, chunks, top_n=3):
+    if not chunks:
+        return []
+    return _top_n(chunks, _predict(question, chunks), top_n)
+
+def rerank_many(question, chunk_lists, top_n=3):
+    """
+    Rerank several candidate lists for the same question with one
+    cross-encoder pass over their distinct chunks.
+    """
+    unique = list(dict.fromkeys(chunk for chunks in chunk_lists for chunk in chunks))
+    if not unique:
+        return [[] for _ in chunk_lists]
+
+    unique_scores = _predict(question, unique)
+    position = {chunk: i for i, chunk in enumerate(unique)}
 
-    return [chunk for chunk, _ in ranked[:top_n]]
+    return [
+        _top_n(chunks, unique_scores[[position[chunk] for chunk in chunks]], top_n)
+        for chunks in chunk_lists
+    ]
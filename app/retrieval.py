@@ -1,17 +1,15 @@
+import numpy as np
+
 from app.embeddings import embed_texts
 from app.vectordb import query_chunks
 
-def retrieve_candidates(question, threshold=0.5):
-    query_embedding = embed_texts([question])[0]
+def retrieve_candidates(question, threshold=0.5, query_embedding=None):
+    # Callers that already embedded the question pass query_embedding
+    if query_embedding is None:
+        query_embedding = embed_texts([question])[0]
     results = query_chunks(query_embedding)
 
-    candidates = []
-    for doc, dist in zip(
-        results["documents"][0],
-        results["distances"][0]
-    ):
-        similarity = 1 - dist
-        if similarity >= threshold:
-            candidates.append(doc)
-
-    return candidates
+    # Keep documents whose similarity (1 - cosine distance) clears the threshold
+    docs = results["documents"][0]
+    similarities = 1 - np.asarray(results["distances"][0], dtype=np.float64)
+    return [docs[i] for i in np.flatnonzero(similarities >= threshold)]
@@ -1,5 +1,8 @@
-import chromadb
 import os
+import threading
+
+import chromadb
+import numpy as np
 
 # Ensure data directory exists
 os.makedirs("data/chroma_db", exist_ok=True)
@@ -19,29 +22,188 @@ except AttributeError:
         )
     )
 
+# ChromaDB 0.5+ takes NumPy embeddings directly; older versions need nested
+# lists (one Python float per component)
+try:
+    NUMPY_EMBEDDINGS = tuple(int(p) for p in chromadb.__version__.split(".")[:2]) >= (0, 5)
+except ValueError:
+    NUMPY_EMBEDDINGS = False
+
+def _as_chroma_embeddings(embeddings):
+    """2-D float32 embeddings in the form the installed ChromaDB accepts."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return embeddings if NUMPY_EMBEDDINGS else embeddings.tolist()
+
 collection = client.get_or_create_collection(
     name="documents",
     metadata={"hnsw:space": "cosine"}
 )
 
-def add_chunks(chunks, embeddings, source):
-    ids = [f"{source}_{i}" for i in range(len(chunks))]
-    metadatas = [{"source": source} for _ in chunks]
+# Small collections are also searched exactly from an in-memory copy of
+# their embeddings (one BLAS matrix product), skipping Chroma's per-query
+# SQLite/HNSW overhead. Larger ones (~1.5 KB per 384-d vector) use Chroma.
+FLAT_INDEX_MAX_VECTORS = int(os.getenv("FLAT_INDEX_MAX_VECTORS", 100_000))
 
-    collection.add(
-        documents=chunks,
-        embeddings=embeddings.tolist(),
-        metadatas=metadatas,
-        ids=ids
-    )
-    # ChromaDB v0.4+ auto-persists, so this is optional
-    try:
+
+class _FlatIndex:
+    """Exact cosine search over an in-memory copy of the collection."""
+
+    def __init__(self, dim):
+        self._lock = threading.Lock()
+        self._ids = set()
+        self._documents = []
+        self._embeddings = np.empty((1024, dim), dtype=np.float32)  # first len(_documents) rows used
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, ids, documents, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        # Store unit vectors so the dot product is the cosine similarity
+        embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        with self._lock:
+            for chunk_id, document, embedding in zip(ids, documents, embeddings):
+                if chunk_id in self._ids:
+                    continue  # Chroma keeps the first add of an id as well
+                size = len(self._documents)
+                if size == len(self._embeddings):
+                    # Grow by doubling so appends stay amortized O(1)
+                    grown = np.empty((2 * size, self._embeddings.shape[1]), dtype=np.float32)
+                    grown[:size] = self._embeddings
+                    self._embeddings = grown
+                self._embeddings[size] = embedding
+                self._ids.add(chunk_id)
+                self._documents.append(document)
+
+    def query(self, query_embeddings, top_k):
+        """Chroma-style result dict: per query, documents and cosine distances, nearest first."""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        with self._lock:
+            size = len(self._documents)
+            similarities = queries @ self._embeddings[:size].T
+            documents = self._documents[:size]
+
+        k = min(top_k, size)
+        results = {"documents": [], "distances": []}
+        for row in similarities:
+            # Top k by similarity: O(n) partition, then sort only those
+            top = np.argpartition(row, -k)[-k:] if k < size else np.arange(size)
+            top = top[np.argsort(-row[top], kind="stable")]
+            results["documents"].append([documents[i] for i in top])
+            results["distances"].append((1 - row[top]).tolist())
+        return results
+
+
+_flat_index = None  # In-memory copy of the collection, if loaded
+_flat_lock = threading.Lock()
+
+def _get_flat_index():
+    """
+    The in-memory index, or None if the collection is empty or too large.
+
+    Other server workers write to the same collection without updating this
+    process's copy, so the copy is checked against collection.count() (a
+    cheap COUNT query) on every call and reloaded when it is stale.
+    """
+    global _flat_index
+    count = collection.count()
+    if count == 0 or count > FLAT_INDEX_MAX_VECTORS:
+        _flat_index = None  # Nothing to load, or free the memory and use Chroma
+        return None
+
+    index = _flat_index
+    if index is not None and len(index) == count:
+        return index
+
+    with _flat_lock:
+        if _flat_index is None or len(_flat_index) != collection.count():
+            data = collection.get(include=["embeddings", "documents"])
+            embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+            index = _FlatIndex(embeddings.shape[1])
+            index.add(data["ids"], data["documents"], embeddings)
+            _flat_index = index
+        return _flat_index
+
+# Chunks are buffered and written in large add() calls: each call is one
+# SQLite transaction + HNSW insert, so fewer, bigger calls ingest faster
+ADD_BATCH_SIZE = 256
+_pending = {"ids": [], "documents": [], "embeddings": [], "metadatas": []}
+_pending_lock = threading.Lock()
+
+def add_chunks(chunks, embeddings, source, start_index=0):
+    """Queue chunks for the collection; call flush_chunks() when a document is done."""
+    # start_index keeps ids unique when a document is added in batches
+    ids = [f"{source}_{i}" for i in range(start_index, start_index + len(chunks))]
+
+    with _pending_lock:
+        _pending["ids"].extend(ids)
+        _pending["documents"].extend(chunks)
+        _pending["embeddings"].append(np.asarray(embeddings, dtype=np.float32))
+        _pending["metadatas"].extend({"source": source} for _ in chunks)
+        if len(_pending["ids"]) >= ADD_BATCH_SIZE:
+            _flush_locked()
+
+def flush_chunks():
+    """Write any queued chunks to the collection."""
+    with _pending_lock:
+        _flush_locked()
+
+def discard_chunks(source):
+    """Drop queued (not yet written) chunks of source, e.g. after it failed to process."""
+    with _pending_lock:
+        keep = [metadata["source"] != source for metadata in _pending["metadatas"]]
+        if all(keep):
+            return
+        embeddings = np.concatenate(_pending["embeddings"])[keep]
+        for key in ("ids", "documents", "metadatas"):
+            _pending[key][:] = [value for value, kept in zip(_pending[key], keep) if kept]
+        _pending["embeddings"][:] = [embeddings] if len(embeddings) else []
+
+def _flush_locked():
+    global _flat_index
+    if not _pending["ids"]:
+        return
+    # Take the batch out of the queue first: if add() fails (duplicate ids,
+    # wrong dimension) the batch is dropped rather than retried on every
+    # later flush
+    batch = {key: list(values) for key, values in _pending.items()}
+    for values in _pending.values():
+        values.clear()
+    embeddings = np.concatenate(batch["embeddings"])
+    # Under _flat_lock so a concurrent first load of the in-memory index
+    # can't miss this batch
+    with _flat_lock:
+        collection.add(
+            documents=batch["documents"],
+            embeddings=_as_chroma_embeddings(embeddings),
+            metadatas=batch["metadatas"],
+            ids=batch["ids"]
+        )
+        if _flat_index is not None:
+            _flat_index.add(batch["ids"], batch["documents"], embeddings)
+            if len(_flat_index) > FLAT_INDEX_MAX_VECTORS:
+                _flat_index = None  # Outgrew it; free the memory and use Chroma
+    # Only the legacy duckdb client needs an explicit persist
+    # (ChromaDB v0.4+ auto-persists)
+    if hasattr(client, "persist"):
         client.persist()
-    except AttributeError:
-        pass  # New ChromaDB versions auto-persist
 
 def query_chunks(query_embedding, top_k=8):
+    flat_index = _get_flat_index()
+    if flat_index is not None:
+        return flat_index.query(np.reshape(query_embedding, (1, -1)), top_k)
+    return collection.query(
+        query_embeddings=_as_chroma_embeddings(np.reshape(query_embedding, (1, -1))),
+        n_results=top_k
+    )
+
+def query_chunks_batch(query_embeddings, top_k=8):
+    # One collection query for several embeddings; results are per query
+    flat_index = _get_flat_index()
+    if flat_index is not None:
+        return flat_index.query(query_embeddings, top_k)
     return collection.query(
-        query_embeddings=[query_embedding.tolist()],
+        query_embeddings=_as_chroma_embeddings(query_embeddings),
         n_results=top_k
     )